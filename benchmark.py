@@ -0,0 +1,300 @@
+import gc
+import json
+import os
+import platform
+import re
+import subprocess
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+
+from lxml import etree
+
+from utils import TIME_SLICE_EVENTS
+from events import Event
+from squawka_match import TS_RE, LOC, COORS, BOOLS, FLOATS, INTS, DATES
+from squawka_match import _filter_type, _parse_node, SquawkaMatch
+from synthetic import generate_match
+from live import LiveMatch
+
+
+def _event_nodes(path):
+    nodes = []
+    for node in etree.parse(path).iter('event'):
+        ftype = _filter_type(node.getparent())
+        if ftype in TIME_SLICE_EVENTS:
+            ts0, ts1 = TS_RE.match(node.getparent().attrib['name']).groups()
+            nodes.append((ftype, node, int(ts0), int(ts1)))
+    return nodes
+
+
+def _traced_size(build):
+    """Memory held by the output of `build` (in bytes)"""
+    gc.collect()
+    tracemalloc.start()
+    try:
+        records = build()
+        size, _ = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return size, len(records)
+
+
+def event_memory(path):
+    """
+    Bytes per event of the events of a match parsed as nested dicts
+    (with a timeslice dict per event) vs. as compact Event records.
+
+    Returns: dict with `events`, `dict` and `event` bytes per event
+    """
+    nodes = _event_nodes(path)
+
+    def as_dicts():
+        return [_parse_node(n, ts={'timeslice': {'from': ts0, 'to': ts1}})
+                for _, n, ts0, ts1 in nodes]
+
+    def as_events():
+        slices = {}             # a shared (from, to) tuple per slice
+        return [Event.from_dict(_parse_node(n), ftype=f, ts=slices.setdefault(
+            (ts0, ts1), (ts0, ts1))) for f, n, ts0, ts1 in nodes]
+
+    dict_size, n_events = _traced_size(as_dicts)
+    event_size, _ = _traced_size(as_events)
+    return {'events': n_events,
+            'dict': dict_size / n_events,
+            'event': event_size / n_events}
+
+
+def _legacy_parse_node(node, **kwargs):
+    """Reference decoder, as before the converter dispatch table"""
+    attrs = {k: _legacy_parse_attr(k, v) for k, v in node.attrib.items()}
+    children = {}
+    for c in list(node):
+        for k, v in [(c.tag, c.text)] + list(c.attrib.items()):
+            c_key = c.tag + '_' + k if k in c.attrib else k
+            children[c_key] = _legacy_parse_attr(k, v)
+    return {**attrs, **children, **kwargs}
+
+
+def _legacy_parse_attr(attr_key, attr_val):
+    if attr_key in COORS:
+        x, y = re.match(LOC, attr_val).groups()
+        return {'x': float(x), 'y': float(y)}
+    elif attr_key in BOOLS:
+        return attr_val == 'true' or attr_val == 'yes'
+    elif attr_key in FLOATS:
+        return float(attr_val)
+    elif attr_key in INTS:
+        return int(attr_val)
+    elif attr_key in DATES:
+        return datetime.strptime(attr_val, '%d/%m/%Y')
+    return attr_val
+
+
+def decode_throughput(path, repeat=5):
+    """
+    Attributes decoded per second by _parse_node over all event, player
+    and team nodes of a match, vs. the legacy decoder. Attributes are
+    counted as node attributes plus child texts and child attributes.
+
+    Returns: dict with `attrs` and `fast`, `legacy` attrs/sec
+    """
+    tree = etree.parse(path)
+    nodes = list(tree.iter('event', 'player', 'team'))
+    n_attrs = sum(len(n.attrib) + sum(1 + len(c.attrib) for c in n)
+                  for n in nodes)
+    res = {'attrs': n_attrs}
+    decoders = (('fast', _parse_node), ('legacy', _legacy_parse_node))
+    for name, parse in decoders:
+        best = float('inf')
+        for _ in range(repeat):
+            start = time.perf_counter()
+            for node in nodes:
+                parse(node)
+            best = min(best, time.perf_counter() - start)
+        res[name] = n_attrs / best
+    return res
+
+
+def _measure(func, setup=None, repeat=3):
+    """
+    Best wall time over `repeat` calls of `func` and peak traced memory
+    of one extra call. If given, `setup` runs untimed before every call
+    and its output is passed to `func`.
+    """
+    best = float('inf')
+    for _ in range(repeat):
+        arg = setup() if setup is not None else None
+        start = time.perf_counter()
+        func(arg)
+        best = min(best, time.perf_counter() - start)
+    arg = setup() if setup is not None else None
+    gc.collect()
+    tracemalloc.start()
+    try:
+        func(arg)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return best, peak
+
+
+def _git_revision():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_suite(events_per_filter=150, n_matches=8, breaks=(0, 1, 3),
+              repeat=3):
+    """
+    Run the benchmark suite over synthetic matches (see synthetic.py).
+
+    Returns: dict with `meta` (parameters, git revision, etc.) and
+        `results`, mapping benchmark names to seconds, throughput (items
+        per second), unit and peak traced memory in bytes
+    """
+    import export
+    xml = generate_match(events_per_filter=events_per_filter)
+    path = 'synthetic_1000.xml'
+    match = SquawkaMatch(xml, path=path)
+    table = match.event_table
+    n_events, n_timed = len(table), len(table.timed_idxs())
+    n_attempts = len(table.chains()[3])
+
+    def new_match():
+        return SquawkaMatch(xml, path=path)
+
+    benchmarks = [
+        ('construction', lambda _: SquawkaMatch(xml, path=path), None,
+         n_events, 'events')]
+    for ftype in TIME_SLICE_EVENTS:
+        benchmarks.append((
+            'filter_events[{}]'.format(ftype),
+            lambda _, ftype=ftype: match._get_filter_events(ftype), None,
+            len(table.filter_idxs(ftype)), 'events'))
+    benchmarks.append((
+        'get_timed_events', lambda m: list(m.get_timed_events()),
+        new_match, n_timed, 'events'))
+    for b in breaks:
+        benchmarks.append((
+            'get_attempts[breaks={}]'.format(b),
+            lambda m, b=b: list(m.get_attempts(breaks=b)),
+            new_match, n_attempts, 'attempts'))
+    benchmarks.append((
+        'xGs', lambda m: list(m.xGs()), new_match, n_attempts, 'attempts'))
+    benchmarks.append((
+        'event_rows', lambda m: [dict(row) for row in m.event_rows()],
+        new_match, n_timed, 'events'))
+    benchmarks.append((
+        'event_batches', lambda m: list(m.event_batches()),
+        new_match, n_timed, 'events'))
+    # last poll of a live match, one time slice after the previous one
+    previous = generate_match(events_per_filter=events_per_filter, until=85)
+
+    def live_match():
+        live = LiveMatch(path)
+        live.update(previous)
+        return live
+    benchmarks.append((
+        'live_update', lambda live: live.update(xml) + live.finish(),
+        live_match, 1, 'polls'))
+    results = {}
+    for name, func, setup, items, unit in benchmarks:
+        seconds, peak = _measure(func, setup=setup, repeat=repeat)
+        results[name] = {'seconds': seconds, 'throughput': items / seconds,
+                         'unit': unit, 'peak_bytes': peak}
+    # export end to end from a local jsonl dump
+    with tempfile.TemporaryDirectory() as tmpdir:
+        source = os.path.join(tmpdir, 'docs.jsonl')
+        with open(source, 'w') as f:
+            for idx in range(n_matches):
+                data = generate_match(
+                    events_per_filter=events_per_filter, seed=idx)
+                url = 'http://s3-irl-synthetic.squawka.com/ingame/{}'.format(
+                    1000 + idx)
+                f.write(json.dumps({'url': url, 'data': data}) + '\n')
+        output = os.path.join(tmpdir, 'xGs.csv')
+        seconds, peak = _measure(
+            lambda _: export._mongo_export_xGs(output=output, source=source),
+            repeat=repeat)
+        results['export'] = {'seconds': seconds,
+                             'throughput': n_matches / seconds,
+                             'unit': 'matches', 'peak_bytes': peak}
+    meta = {'revision': _git_revision(),
+            'date': datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'events_per_filter': events_per_filter,
+            'n_matches': n_matches, 'repeat': repeat}
+    return {'meta': meta, 'results': results}
+
+
+def compare(old, new, threshold=0.1):
+    """
+    Print throughput and peak memory of two suite runs side by side,
+    flagging throughput regressions larger than `threshold`.
+    """
+    print('{:<32}{:>14}{:>14}{:>9}{:>12}'.format(
+        'benchmark', 'old', 'new', 'ratio', 'peak MB'))
+    for name, res in new['results'].items():
+        if name not in old['results']:
+            continue
+        before, after = old['results'][name]['throughput'], res['throughput']
+        ratio = after / before
+        flag = '  <- regression' if ratio < 1 - threshold else ''
+        print('{:<32}{:>14.0f}{:>14.0f}{:>8.2f}x{:>12.2f}{}'.format(
+            name, before, after, ratio, res['peak_bytes'] / 1024 ** 2, flag))
+
+
+def _print_suite(suite):
+    print('{:<32}{:>12}{:>18}{:>12}'.format(
+        'benchmark', 'ms', 'throughput', 'peak MB'))
+    for name, res in suite['results'].items():
+        print('{:<32}{:>12.2f}{:>12.0f} {:<6}{:>11.2f}'.format(
+            name, res['seconds'] * 1000, res['throughput'],
+            res['unit'][:6] + '/s', res['peak_bytes'] / 1024 ** 2))
+
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser()
+    parser.add_argument('benchmark', choices=('suite', 'memory', 'decode'))
+    parser.add_argument('paths', nargs='*',
+                        help='squawka xml files (memory and decode)')
+    parser.add_argument('--events_per_filter', type=int, default=150)
+    parser.add_argument('--n_matches', type=int, default=8)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--save', help='Save suite results to a json file')
+    parser.add_argument('--compare',
+                        help='Compare suite results to a saved json file')
+    args = parser.parse_args()
+
+    if args.benchmark == 'suite':
+        suite = run_suite(events_per_filter=args.events_per_filter,
+                          n_matches=args.n_matches, repeat=args.repeat)
+        _print_suite(suite)
+        if args.compare:
+            with open(args.compare) as f:
+                compare(json.load(f), suite)
+        if args.save:
+            with open(args.save, 'w') as f:
+                json.dump(suite, f, indent=2)
+
+    for path in args.paths:
+        if args.benchmark == 'memory':
+            res = event_memory(path)
+            print('{}: {} events; {:.0f} bytes/event as dicts, '
+                  '{:.0f} bytes/event as Event records ({:.1f}x)'.format(
+                      path, res['events'], res['dict'], res['event'],
+                      res['dict'] / res['event']))
+        elif args.benchmark == 'decode':
+            res = decode_throughput(path)
+            print('{}: {} attrs; {:.0f} attrs/sec, legacy {:.0f} attrs/sec '
+                  '({:.1f}x)'.format(path, res['attrs'], res['fast'],
+                                     res['legacy'],
+                                     res['fast'] / res['legacy']))
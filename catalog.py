@@ -0,0 +1,198 @@
+import os
+import sqlite3
+from datetime import date, datetime, timedelta, timezone
+
+from squawka_match import COMP_ID_RE, read_header
+
+INDEX_FILE = '.squawka_index.sqlite'
+TEAM_PROPS = ('id', 'short_name', 'long_name')
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS matches (
+    filename TEXT PRIMARY KEY,
+    mtime REAL,
+    size INTEGER,
+    competition TEXT,
+    match_id TEXT,
+    kickoff TEXT,
+    season INTEGER,
+    name TEXT,
+    venue TEXT,
+    home_id TEXT,
+    home_short_name TEXT,
+    home_long_name TEXT,
+    away_id TEXT,
+    away_short_name TEXT,
+    away_long_name TEXT,
+    goals_home INTEGER,
+    goals_away INTEGER
+)
+"""
+COLUMNS = ('filename', 'mtime', 'size', 'competition', 'match_id',
+           'kickoff', 'season', 'name', 'venue',
+           'home_id', 'home_short_name', 'home_long_name',
+           'away_id', 'away_short_name', 'away_long_name',
+           'goals_home', 'goals_away')
+DATE_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+
+def _season(kickoff):
+    """Season as its starting year (seasons are assumed to start in July)"""
+    return kickoff.year if kickoff.month >= 7 else kickoff.year - 1
+
+
+def _date_key(d, end=False):
+    """Transform a date or datetime into a comparable kickoff string.
+    Dates used as end of a range are inclusive."""
+    if isinstance(d, datetime):
+        if d.tzinfo is not None:
+            d = d.astimezone(timezone.utc)
+        return d.strftime(DATE_FORMAT)
+    if isinstance(d, date):
+        if end:
+            d += timedelta(days=1)
+        return d.strftime('%Y-%m-%d')
+    raise ValueError("Expected date or datetime, got {}".format(type(d)))
+
+
+class MatchCatalog(object):
+    """
+    Persistent SQLite index over the match headers (competition, match id,
+    kickoff, teams, score and venue) of a directory of squawka xmls.
+    Files are only re-read when their mtime or size changes.
+
+    Parameters:
+    -----------
+    dirpath: str, directory with the squawka xml files
+    index_path: str, path to the index database (defaults to a hidden
+        file inside `dirpath`)
+    """
+    def __init__(self, dirpath, index_path=None):
+        self.dirpath = dirpath
+        self.index_path = index_path or os.path.join(dirpath, INDEX_FILE)
+        self.conn = sqlite3.connect(self.index_path)
+        self.conn.execute(SCHEMA)
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def _read_row(self, filename, stat):
+        header = read_header(os.path.join(self.dirpath, filename))
+        comp, match_id = COMP_ID_RE.match(filename).groups()
+        home, away = header['team_home'], header['team_away']
+        kickoff = header['kickoff']
+        return (filename, stat.st_mtime, stat.st_size, comp, match_id,
+                _date_key(kickoff), _season(kickoff),
+                header['name'], header['venue'],
+                home['id'], home.get('short_name'), home.get('long_name'),
+                away['id'], away.get('short_name'), away.get('long_name'),
+                header['goals_home'], header['goals_away'])
+
+    def refresh(self):
+        """
+        Synchronize the index with the directory: (re-)index new and
+        modified files and drop entries of removed files.
+
+        Returns: (updated, removed), number of updated and removed entries
+        """
+        indexed = {f: (mtime, size) for f, mtime, size in self.conn.execute(
+            'SELECT filename, mtime, size FROM matches')}
+        seen, rows = set(), []
+        for entry in os.scandir(self.dirpath):
+            if not entry.is_file() or not COMP_ID_RE.match(entry.name):
+                continue
+            seen.add(entry.name)
+            stat = entry.stat()
+            if indexed.get(entry.name) == (stat.st_mtime, stat.st_size):
+                continue
+            try:
+                rows.append(self._read_row(entry.name, stat))
+            except Exception:
+                print("Couldn't parse file: {}".format(entry.name))
+                seen.discard(entry.name)    # don't keep a stale entry
+        removed = [(f,) for f in indexed if f not in seen]
+        with self.conn:
+            self.conn.executemany(
+                'INSERT OR REPLACE INTO matches VALUES ({})'.format(
+                    ', '.join('?' for _ in COLUMNS)), rows)
+            self.conn.executemany(
+                'DELETE FROM matches WHERE filename = ?', removed)
+        return len(rows), len(removed)
+
+    def find(self, team1=None, team2=None, competition=None, season=None,
+             start=None, end=None, team_prop='short_name'):
+        """
+        Query the index. All arguments are optional and combined.
+
+        Parameters:
+        -----------
+        team1, team2: str, teams involved in the match (in any order)
+        competition: str, prefix of the match file names (e.g. 'laliga')
+        season: int, starting year of the season
+        start, end: date or datetime, kickoff range (dates are inclusive)
+        team_prop: str, team property to match teams by, one of
+            'id', 'short_name', 'long_name'
+
+        Returns: generator of dicts with the indexed columns, with
+            `kickoff` as a UTC datetime and the file `path`
+        """
+        if team_prop not in TEAM_PROPS:
+            raise ValueError("Unknown team property: {}".format(team_prop))
+        home, away = 'home_' + team_prop, 'away_' + team_prop
+        clauses, params = [], []
+        if team1 is not None and team2 is not None:
+            clauses.append('(({0} = ? AND {1} = ?) OR ({1} = ? AND {0} = ?))'
+                           .format(home, away))
+            params.extend([team1, team2, team1, team2])
+        elif team1 is not None or team2 is not None:
+            team = team1 if team1 is not None else team2
+            clauses.append('({} = ? OR {} = ?)'.format(home, away))
+            params.extend([team, team])
+        if competition is not None:
+            clauses.append('substr(filename, 1, ?) = ?')
+            params.extend([len(competition), competition])
+        if season is not None:
+            clauses.append('season = ?')
+            params.append(season)
+        if start is not None:
+            clauses.append('kickoff >= ?')
+            params.append(_date_key(start))
+        if end is not None:
+            clauses.append('kickoff {} ?'.format(
+                '<=' if isinstance(end, datetime) else '<'))
+            params.append(_date_key(end, end=True))
+        query = 'SELECT {} FROM matches'.format(', '.join(COLUMNS))
+        if clauses:
+            query += ' WHERE ' + ' AND '.join(clauses)
+        query += ' ORDER BY kickoff, filename'
+        for values in self.conn.execute(query, params):
+            row = dict(zip(COLUMNS, values))
+            row['kickoff'] = datetime.strptime(
+                row['kickoff'], DATE_FORMAT).replace(tzinfo=timezone.utc)
+            row['path'] = os.path.join(self.dirpath, row['filename'])
+            yield row
+
+
+def open_catalog(dirpath, index_path=None):
+    """
+    Open and refresh the MatchCatalog of a directory. If the index can't
+    be written (e.g. read-only or shared data directories), fall back to
+    an in-memory index, i.e. to scanning the headers of the directory.
+    """
+    catalog = None
+    try:
+        catalog = MatchCatalog(dirpath, index_path=index_path)
+        catalog.refresh()
+        return catalog
+    except sqlite3.OperationalError as e:
+        if catalog is not None:
+            catalog.close()
+        print("Couldn't write index ({}), scanning {}".format(e, dirpath))
+    catalog = MatchCatalog(dirpath, index_path=':memory:')
+    catalog.refresh()
+    return catalog
@@ -0,0 +1,190 @@
+from datetime import date, datetime, timedelta, timezone
+
+import numpy as np
+
+from utils import TIME_SLICE_EVENTS
+from events import EventTable, FTYPE_IDS
+from squawka_match import SquawkaMatch
+
+# queryable keys with a hash index -> column
+INDEXES = {'player_id': 'player', 'team_id': 'team', 'ftype': 'ftype',
+           'match': 'match'}
+
+
+def _datetime64(d, end=False):
+    """Transform a date or datetime into a (naive UTC) datetime64. Dates
+    used as end of a range are inclusive (see catalog._date_key)."""
+    if isinstance(d, datetime):
+        if d.tzinfo is not None:
+            d = d.astimezone(timezone.utc).replace(tzinfo=None)
+        return np.datetime64(d, 's')
+    if isinstance(d, date):
+        if end:
+            d += timedelta(days=1)
+        return np.datetime64(d, 's')
+    raise ValueError("Expected date or datetime, got {}".format(type(d)))
+
+
+def _group(values):
+    """Hash index over a column: value -> sorted array of row indices"""
+    codes, lookup = np.empty(len(values), dtype=int), {}
+    for idx, value in enumerate(values.tolist()):
+        codes[idx] = lookup.setdefault(value, len(lookup))
+    order = np.argsort(codes, kind='stable')
+    bounds = np.cumsum(np.bincount(codes, minlength=len(lookup)))
+    groups = np.split(order, bounds[:-1])
+    return {value: groups[code] for value, code in lookup.items()}
+
+
+def _as_list(value):
+    return list(value) if isinstance(value, (list, tuple, set)) else [value]
+
+
+class MatchCollection(object):
+    """
+    Columnar in-memory store with the events of many matches, so that
+    cross-match queries (e.g. all shots of a player in a season) don't need
+    to re-parse or re-scan every match.
+
+    Events are stored in a single EventTable (see EventTable.concat) with
+    an extra `match` column pointing to `self.matches`, the background info
+    of each match (see SquawkaMatch._background_info). Hash indexes on
+    player, team, filter type and match are built on first use.
+
+    Parameters:
+    -----------
+    matches: iterable of SquawkaMatch
+    """
+    def __init__(self, matches):
+        tables, self.matches = [], []
+        for m in matches:
+            tables.append(m.event_table)
+            self.matches.append(m._background_info())
+        self.table = EventTable.concat(tables)
+        self.match = np.repeat(
+            np.arange(len(tables), dtype=np.int32), [len(t) for t in tables])
+        self.kickoff = np.array(
+            [_datetime64(bg['kickoff']) for bg in self.matches],
+            dtype='datetime64[s]')
+        self._indexes = {}
+        self._spatial = None
+
+    @classmethod
+    def from_dir(cls, dirpath, cache=None, index_path=None, **kwargs):
+        """
+        Load the matches of a directory, optionally restricted to those
+        found by MatchCatalog.find with the given kwargs (e.g. season or
+        competition). Pass a MatchCache (directory) as `cache` to avoid
+        re-parsing the xml files.
+        """
+        from catalog import open_catalog
+        with open_catalog(dirpath, index_path=index_path) as catalog:
+            paths = [row['path'] for row in catalog.find(**kwargs)]
+        return cls(SquawkaMatch(path, cache=cache) for path in paths)
+
+    def __len__(self):
+        return len(self.table)
+
+    def index(self, key):
+        """Hash index for one of INDEXES (value -> sorted row indices)"""
+        if key not in INDEXES:
+            raise ValueError("Unknown index: {}".format(key))
+        if key not in self._indexes:
+            if key == 'match':
+                values = np.array(
+                    [bg['match'] for bg in self.matches], dtype=object)
+                values = values[self.match]
+            else:
+                values = getattr(self.table, INDEXES[key])
+            self._indexes[key] = _group(values)
+        return self._indexes[key]
+
+    def spatial(self):
+        """
+        Grid index over the event coordinates (see spatial.SpatialIndex).
+        Combine with `query` for other filters, e.g.
+        c.spatial().zone('penalty_box', idxs=c.query(competition=...))
+        """
+        if self._spatial is None:
+            from spatial import SpatialIndex
+            self._spatial = SpatialIndex(self.table)
+        return self._spatial
+
+    def _lookup(self, key, values):
+        index = self.index(key)
+        if key == 'ftype':
+            values = [FTYPE_IDS[v] for v in values]
+        empty = np.array([], dtype=int)
+        idxs = [index.get(v, empty) for v in set(values)]
+        if len(idxs) <= 1:
+            return idxs[0] if idxs else empty
+        return np.unique(np.concatenate(idxs))
+
+    def _match_mask(self, competition=None, start=None, end=None):
+        mask = np.ones(len(self.matches), dtype=bool)
+        if competition is not None:
+            mask &= np.array([bg['competition'] in _as_list(competition)
+                              for bg in self.matches], dtype=bool)
+        if start is not None:
+            mask &= self.kickoff >= _datetime64(start)
+        if end is not None:
+            end_key = _datetime64(end, end=True)
+            mask &= self.kickoff <= end_key if isinstance(end, datetime) \
+                else self.kickoff < end_key
+        return mask
+
+    def query(self, player_id=None, team_id=None, ftype=None, match=None,
+              competition=None, start=None, end=None, mins=None):
+        """
+        Row indices of the events matching all given filters. Each of
+        player_id, team_id, ftype, match (match id) and competition can
+        be a single value or a list of values.
+
+        Parameters:
+        -----------
+        start, end: date or datetime, kickoff range (dates are inclusive)
+        mins: tuple (from, to), event time range in minutes (`to` is
+            exclusive). Untimed events are excluded.
+
+        Returns: sorted int array of rows (see `events` and `rows`)
+        """
+        idxs = None
+        keys = (('player_id', player_id), ('team_id', team_id),
+                ('ftype', ftype), ('match', match))
+        # intersect hash lookups, starting from the most selective
+        lookups = sorted((self._lookup(key, _as_list(value))
+                          for key, value in keys if value is not None),
+                         key=len)
+        for rows in lookups:
+            idxs = rows if idxs is None else \
+                np.intersect1d(idxs, rows, assume_unique=True)
+        if idxs is None:
+            idxs = np.arange(len(self.table))
+        if competition is not None or start is not None or end is not None:
+            mask = self._match_mask(competition, start, end)
+            idxs = idxs[mask[self.match[idxs]]]
+        if mins is not None:
+            lo, hi = mins
+            minute = self.table.mins[idxs]
+            idxs = idxs[self.table.timed[idxs] & (minute >= lo) &
+                        (minute < hi)]
+        return idxs
+
+    def events(self, idxs):
+        """Generator of (bg, ftype, event) for the given rows"""
+        table = self.table
+        for idx in idxs:
+            yield (self.matches[self.match[idx]],
+                   TIME_SLICE_EVENTS[table.ftype[idx]], table.records[idx])
+
+    def rows(self, idxs):
+        """
+        Export rows as plain python lists (see EventTable.row_columns),
+        with the background info of their match as extra columns
+        """
+        columns = self.table.row_columns(idxs)
+        match = self.match[idxs]
+        for key in self.matches[0] if self.matches else ():
+            values = [bg[key] for bg in self.matches]
+            columns[key] = [values[m] for m in match.tolist()]
+        return columns
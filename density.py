@@ -0,0 +1,148 @@
+import numpy as np
+
+from squawka_match import _maybe_flip
+from utils import TIME_SLICE_EVENTS
+
+# default pitch grid (x, y), roughly 4.4m x 4.3m cells
+BINS = (24, 16)
+
+
+def event_coordinates(events, point='start', orient=None):
+    """
+    Coordinates of (ftype, event) pairs, e.g. from get_timed_events or
+    the events of an attempt. Unlocated events are skipped.
+
+    Parameters:
+    -----------
+    point: str, 'start' (start or loc coordinates) or 'end'
+    orient: str, team id. If given, events are oriented with respect to
+        this team, flipping them as in get_attempts (see _maybe_flip)
+
+    Returns: dict with `x`, `y` float arrays and `ftype`, `team` and
+        `player` object arrays (to split by, see `bin_counts`)
+    """
+    cols = {'x': [], 'y': [], 'ftype': [], 'team': [], 'player': []}
+    for ftype, e in events:
+        if orient is not None:
+            e = _maybe_flip(ftype, e, orient)
+        coors = e.get('end') if point == 'end' else \
+            e.get('start', e.get('loc'))
+        if coors is None:
+            continue
+        cols['x'].append(coors['x'])
+        cols['y'].append(coors['y'])
+        cols['ftype'].append(ftype)
+        cols['team'].append(e.get('team_id', e.get('team')))
+        cols['player'].append(e.get('player_id'))
+    return _as_arrays(cols)
+
+
+def xG_coordinates(xGs, point='shot'):
+    """
+    Coordinates from the output of SquawkaMatch.xGs (or export rows).
+
+    Parameters:
+    -----------
+    point: str, 'shot' (attempt location), 'assist' (origin of assisted
+        attempts' passes) or 'seq' (all events leading to the attempts,
+        already oriented towards the attacking team)
+    """
+    cols = {'x': [], 'y': [], 'ftype': [], 'team': [], 'player': []}
+    for _, seq, feats in xGs:
+        if point == 'seq':
+            for e in seq:
+                cols['x'].append(e['x'])
+                cols['y'].append(e['y'])
+                cols['ftype'].append(e['ftype'])
+                cols['team'].append(e['team_id'])
+                cols['player'].append(e['player_id'])
+            continue
+        if point == 'assist':
+            if feats['assist_id'] is None:
+                continue
+            x, y = feats['assist_x'], feats['assist_y']
+            player = feats['assist_id']
+        else:
+            x, y, player = feats['x'], feats['y'], feats['player_id']
+        cols['x'].append(x)
+        cols['y'].append(y)
+        cols['ftype'].append('goals_attempts')
+        cols['team'].append(feats['team_id'])
+        cols['player'].append(player)
+    return _as_arrays(cols)
+
+
+def table_coordinates(table, idxs=None, point='start', orient=None):
+    """
+    Vectorized `event_coordinates` over rows of an EventTable (e.g. the
+    table of a SquawkaMatch or of a MatchCollection, with idxs from
+    MatchCollection.query).
+    """
+    idxs = np.arange(len(table)) if idxs is None else np.asarray(idxs)
+    if point == 'end':
+        x, y = table.end_x[idxs], table.end_y[idxs]
+    else:
+        x, y = table.origin(idxs)
+    ftypes = np.array(TIME_SLICE_EVENTS, dtype=object)[table.ftype[idxs]]
+    if orient is not None:
+        flip = (table.team[idxs] != orient) & (ftypes != 'fouls')
+        # tackles are oriented by the tackler team
+        for pos in np.flatnonzero(ftypes == 'tackles'):
+            e = table.records[idxs[pos]]
+            flip[pos] |= e.get('tackler_team') != orient
+        x, y = np.where(flip, 100 - x, x), np.where(flip, 100 - y, y)
+    located = ~np.isnan(x)
+    return {'x': x[located], 'y': y[located], 'ftype': ftypes[located],
+            'team': table.team[idxs][located],
+            'player': table.player[idxs][located]}
+
+
+def _as_arrays(cols):
+    return {key: np.array(values, dtype=float if key in ('x', 'y')
+                          else object)
+            for key, values in cols.items()}
+
+
+def bin_counts(x, y, bins=BINS, by=None, weights=None, normalize=False):
+    """
+    Bin coordinates (0-100) into a pitch grid in a single histogram pass.
+
+    Parameters:
+    -----------
+    bins: (int, int), number of cells along the pitch length and width
+    by: array with a label per coordinate (e.g. coordinates['team']). If
+        given, a grid is computed per distinct label.
+    weights: float array, optional weight per coordinate (e.g. xG)
+    normalize: bool, divide each grid by its total (densities sum to 1)
+
+    Returns: float array (bins[0], bins[1]), or dict label -> grid
+    """
+    x, y = np.asarray(x, dtype=float), np.asarray(y, dtype=float)
+    ranges = [(0, 100), (0, 100)]
+    if by is None:
+        grid, _, _ = np.histogram2d(
+            x, y, bins=bins, range=ranges, weights=weights)
+        return grid / max(grid.sum(), 1e-12) if normalize else grid
+    labels, codes = {}, np.empty(len(x), dtype=int)
+    for idx, label in enumerate(np.asarray(by, dtype=object).tolist()):
+        codes[idx] = labels.setdefault(label, len(labels))
+    if not labels:
+        return {}
+    grids, _ = np.histogramdd(
+        (codes, x, y), bins=(len(labels),) + tuple(bins),
+        range=[(-0.5, len(labels) - 0.5)] + ranges, weights=weights)
+    if normalize:
+        totals = grids.sum(axis=(1, 2), keepdims=True)
+        grids = grids / np.maximum(totals, 1e-12)
+    return {label: grids[code] for label, code in labels.items()}
+
+
+def density(coordinates, bins=BINS, by=None, normalize=False):
+    """
+    Bin the output of one of the *_coordinates functions, optionally
+    split by one of its label columns ('ftype', 'team' or 'player').
+    """
+    return bin_counts(
+        coordinates['x'], coordinates['y'], bins=bins,
+        by=None if by is None else coordinates[by], normalize=normalize)
+
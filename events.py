@@ -0,0 +1,302 @@
+import sys
+from collections.abc import Mapping
+
+import numpy as np
+
+from utils import TIME_SLICE_EVENTS
+
+
+FTYPE_IDS = {f: idx for idx, f in enumerate(TIME_SLICE_EVENTS)}
+
+# event keys stored in their own slot
+FIELDS = ('mins', 'secs', 'player_id', 'type', 'action_type')
+TEAM_KEYS = ('team', 'team_id')
+COORS = ('start', 'end', 'loc')
+COOR_SLOTS = ('start_x', 'start_y', 'end_x', 'end_y', 'loc_x', 'loc_y')
+
+
+def _intern(v):
+    return sys.intern(v) if type(v) is str else v
+
+
+class Event(Mapping):
+    """
+    Compact, read-only event record. Frequent keys are stored in slots,
+    coordinates as flat floats, strings (ids and types) are interned and
+    the filter type is kept as its index in TIME_SLICE_EVENTS. Any other
+    attribute is stored in a tuple of (key, value) pairs.
+
+    Events behave like the parsed event dicts, including nested access to
+    coordinates (e['start']['x']) and the timeslice (e['ts']), so that
+    code written for dicts (e.g. utils.get_team_id, utils.is_loc or
+    plotting) keeps working. Use dict(e) to get a mutable copy.
+    """
+    __slots__ = FIELDS + COOR_SLOTS + (
+        'ftype', 'team_key', 'team', 'ts', 'extra')
+
+    def __init__(self, ftype=None, team_key=None, team=None, ts=None,
+                 extra=(), **kwargs):
+        self.ftype, self.team_key, self.team = ftype, team_key, team
+        self.ts, self.extra = ts, extra
+        for key in FIELDS + COOR_SLOTS:
+            setattr(self, key, kwargs.pop(key, None))
+        if kwargs:
+            raise TypeError("Unknown fields: {}".format(', '.join(kwargs)))
+
+    @classmethod
+    def from_dict(cls, d, ftype=None, ts=None):
+        """
+        Build an Event from a parsed event dict (see _parse_node). Pass the
+        (from, to) tuple of the event's time slice as `ts`, instead of a
+        timeslice in `d`, so that all events of a slice share it.
+        """
+        fields, extra = {}, []
+        if ftype is not None:
+            fields['ftype'] = FTYPE_IDS[ftype]
+        if ts is not None:
+            fields['ts'] = ts
+        # same precedence as utils.get_team_id
+        team_key = 'team' if d.get('team') is not None else 'team_id'
+        for key, value in d.items():
+            if value is None:
+                extra.append((_intern(key), value))
+            elif key in FIELDS:
+                fields[key] = _intern(value)
+            elif key == team_key:
+                fields['team_key'], fields['team'] = key, _intern(value)
+            elif key in COORS:
+                fields[key + '_x'], fields[key + '_y'] = value['x'], value['y']
+            elif key == 'ts':
+                ts = value['timeslice']
+                fields['ts'] = ts['from'], ts['to']
+            else:
+                extra.append((_intern(key), _intern(value)))
+        return cls(extra=tuple(extra), **fields)
+
+    def __getitem__(self, key):
+        if key in FIELDS:
+            value = getattr(self, key)
+        elif key in COORS:
+            x = getattr(self, key + '_x')
+            value = None if x is None else \
+                {'x': x, 'y': getattr(self, key + '_y')}
+        elif key == self.team_key:
+            value = self.team
+        elif key == 'ts':
+            value = None if self.ts is None else \
+                {'timeslice': {'from': self.ts[0], 'to': self.ts[1]}}
+        else:
+            value = None
+        if value is None:
+            # missing, or present with a None value (kept in extra)
+            for k, v in self.extra:
+                if k == key:
+                    return v
+            raise KeyError(key)
+        return value
+
+    def __iter__(self):
+        for key in FIELDS:
+            if getattr(self, key) is not None:
+                yield key
+        if self.team_key is not None:
+            yield self.team_key
+        for key in COORS:
+            if getattr(self, key + '_x') is not None:
+                yield key
+        if self.ts is not None:
+            yield 'ts'
+        for key, _ in self.extra:
+            yield key
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def __repr__(self):
+        return '{}({})'.format(type(self).__name__, dict(self))
+
+    def __reduce__(self):
+        return _event_from_slots, tuple(
+            getattr(self, key) for key in self.__slots__)
+
+    @property
+    def located(self):
+        """Whether the event has start and end, or loc coordinates (see
+        EventTable.located)"""
+        return (self.start_x is not None and self.end_x is not None) or \
+            self.loc_x is not None
+
+    def flipped(self):
+        """Return a copy with coordinates flipped (see _flip_loc)"""
+        e = _event_from_slots(
+            *(getattr(self, key) for key in self.__slots__))
+        for key in COOR_SLOTS:
+            value = getattr(self, key)
+            if value is not None:
+                setattr(e, key, 100 - value)
+        return e
+
+
+def _event_from_slots(*values):
+    e = Event.__new__(Event)
+    for key, value in zip(Event.__slots__, values):
+        setattr(e, key, value)
+    return e
+
+
+def _nan(v):
+    return np.nan if v is None else v
+
+
+class EventTable(object):
+    """
+    Column-oriented table with all events of a match, built in a single
+    pass over the parsed events. Row `i` of every column corresponds to
+    `records[i]`, the parsed Event (event dicts are converted).
+
+    Columns:
+    --------
+    ftype: int8, index of the filter type in TIME_SLICE_EVENTS
+    mins, secs: int32, event time (-1 if the event isn't timed)
+    team, player: object, team and player ids (None if missing)
+    start_x, start_y, end_x, end_y, loc_x, loc_y: float64, coordinates
+        (NaN if missing)
+    type, action_type: object, event types ('' if missing)
+    """
+    columns = ('ftype', 'timed', 'mins', 'secs', 'team', 'player') + \
+        COOR_SLOTS + ('type', 'action_type')
+
+    def __init__(self, ftypes, records):
+        records = [e if isinstance(e, Event) else Event.from_dict(e, ftype=f)
+                   for f, e in zip(ftypes, records)]
+        self.records = records
+        self.ftype = np.array([FTYPE_IDS[f] for f in ftypes], dtype=np.int8)
+        self.timed = np.array(
+            [e.mins is not None and e.secs is not None for e in records],
+            dtype=bool)
+        self.mins = np.array(
+            [-1 if e.mins is None else e.mins for e in records],
+            dtype=np.int32)
+        self.secs = np.array(
+            [-1 if e.secs is None else e.secs for e in records],
+            dtype=np.int32)
+        self.team = np.array([e.team for e in records], dtype=object)
+        self.player = np.array([e.player_id for e in records], dtype=object)
+        for key in COOR_SLOTS:
+            col = [_nan(getattr(e, key)) for e in records]
+            setattr(self, key, np.array(col, dtype=float))
+        self.type = np.array(
+            [e.type or '' for e in records], dtype=object)
+        self.action_type = np.array(
+            [e.action_type or '' for e in records], dtype=object)
+        self._chains = None
+
+    @classmethod
+    def concat(cls, tables):
+        """
+        Concatenate the rows of several tables (e.g. of different matches)
+        into a new table. Possession chains are only meaningful per match.
+        """
+        if not tables:
+            return cls([], [])
+        table = cls.__new__(cls)
+        table.records = [e for t in tables for e in t.records]
+        for col in cls.columns:
+            setattr(table, col,
+                    np.concatenate([getattr(t, col) for t in tables]))
+        table._chains = None
+        return table
+
+    def __len__(self):
+        return len(self.records)
+
+    @property
+    def located(self):
+        has_start, has_end = ~np.isnan(self.start_x), ~np.isnan(self.end_x)
+        return (has_start & has_end) | ~np.isnan(self.loc_x)
+
+    def ftype_name(self, idx):
+        return TIME_SLICE_EVENTS[self.ftype[idx]]
+
+    def filter_idxs(self, filter_type):
+        """Row indices of the events of a given filter type"""
+        return np.flatnonzero(self.ftype == FTYPE_IDS[filter_type])
+
+    def timed_idxs(self, sort=False):
+        """
+        Row indices of timed events, optionally sorted by (mins, secs).
+        Sorting is stable so that simultaneous events keep document order.
+        """
+        idxs = np.flatnonzero(self.timed)
+        if sort:
+            order = np.lexsort((self.secs[idxs], self.mins[idxs]))
+            idxs = idxs[order]
+        return idxs
+
+    def chains(self):
+        """
+        Segment the timed events, sorted by time, into possession chains in
+        a single pass. Every goal attempt closes a chain, and each event is
+        assigned the number of events by a team other than the attempting
+        team between itself and the attempt closing its chain (breaks).
+
+        Returns: (idxs, chain, breaks, ends)
+        --------
+        idxs: int array, sorted row indices of the timed events
+        chain: int array, chain id of each event (a position in idxs)
+        breaks: int array, breaks of each event (-1 for events after
+            the last attempt)
+        ends: int array, position in idxs of the attempt closing each chain
+        """
+        if self._chains is not None:
+            return self._chains
+        idxs = self.timed_idxs(sort=True)
+        n = len(idxs)
+        is_attempt = self.ftype[idxs] == FTYPE_IDS['goals_attempts']
+        ends = np.flatnonzero(is_attempt)
+        chain = np.cumsum(is_attempt) - is_attempt
+        # cumulative number of events per team
+        teams = {}
+        codes = np.array([teams.setdefault(t, len(teams))
+                          for t in self.team[idxs]], dtype=int)
+        counts = np.zeros((len(teams), n + 1), dtype=int)
+        for code in range(len(teams)):
+            counts[code, 1:] = np.cumsum(codes == code)
+        breaks = np.full(n, -1)
+        closed = np.flatnonzero(chain < len(ends))
+        end = ends[chain[closed]]
+        same = counts[codes[end], end] - counts[codes[end], closed]
+        breaks[closed] = (end - closed) - same
+        self._chains = idxs, chain, breaks, ends
+        return self._chains
+
+    def origin(self, idxs=None):
+        """(x, y) arrays of the start coordinates of rows `idxs` (all rows
+        by default), falling back to `loc` (NaN if neither is present)"""
+        if idxs is None:
+            idxs = slice(None)
+        has_start = ~np.isnan(self.start_x[idxs])
+        return (np.where(has_start, self.start_x[idxs], self.loc_x[idxs]),
+                np.where(has_start, self.start_y[idxs], self.loc_y[idxs]))
+
+    def row_columns(self, idxs):
+        """
+        Export rows `idxs` as plain python lists in the layout used by
+        SquawkaMatch.event_rows. Start coordinates fall back to `loc` (see
+        `origin`), and missing end coordinates are exported as ''.
+        """
+        x, y = self.origin(idxs)
+        end_x, end_y = self.end_x[idxs], self.end_y[idxs]
+        no_end = np.isnan(end_x)
+        return {
+            'x': x.tolist(),
+            'y': y.tolist(),
+            'end_x': np.where(no_end, '', end_x.astype(object)).tolist(),
+            'end_y': np.where(no_end, '', end_y.astype(object)).tolist(),
+            'mins': self.mins[idxs].tolist(),
+            'secs': self.secs[idxs].tolist(),
+            'ftype': [TIME_SLICE_EVENTS[f] for f in self.ftype[idxs]],
+            'type': self.type[idxs].tolist(),
+            'action_type': self.action_type[idxs].tolist(),
+            'player_id': self.player[idxs].tolist(),
+            'team_id': self.team[idxs].tolist()}
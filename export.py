@@ -1,32 +1,666 @@
-
 import pymongo
+from bson import json_util
 import csv
+import functools
+import hashlib
+import json
+import os
+import re
+import traceback
+from multiprocessing import Pool
+
+from squawka_match import SquawkaMatch, PARSER_VERSION, _path_ids
+from squawka_match import event_batches
+from stats import Stats, NULL_STATS
+
+
+PROJECTION = {'data': 1, 'url': 1}
+# bump when the exported xG rows change (features, columns, etc.)
+FEATURES_VERSION = 1
+MANIFEST = 'manifest.json'
+SHARD = 'xGs-{:05d}.{}'
+SHARD_RE = re.compile(r'xGs-(\d+)\.(csv|parquet|arrow)$')
+
+
+def mongo_docs(collection, batch_size=100, start_after=None):
+    """
+    Iterate over the documents of a (pymongo or mongomock) collection in
+    `_id` order, fetching only `data` and `url` in batches of
+    `batch_size`. If `start_after` is given, skip documents up to that id.
+    """
+    query = {} if start_after is None else {'_id': {'$gt': start_after}}
+    yield from collection.find(query, projection=PROJECTION,
+                               batch_size=batch_size, sort=[('_id', 1)])
+
+
+def jsonl_docs(path, start_after=None):
+    """
+    Iterate over the documents of a local jsonl dump (e.g. from
+    mongoexport). Documents without `_id` are identified by line number.
+    """
+    with open(path) as f:
+        for idx, line in enumerate(f):
+            doc = json_util.loads(line)
+            doc.setdefault('_id', idx)
+            if start_after is not None and doc['_id'] <= start_after:
+                continue
+            yield {'_id': doc['_id'], 'url': doc['url'], 'data': doc['data']}
+
+
+def _source_key(source):
+    """Identifier of a document source (jsonl path or Mongo uri)"""
+    if source is not None and os.path.isfile(source):
+        return os.path.abspath(source)
+    return source
+
+
+def read_checkpoint(path, output=None, source=None):
+    """
+    Return (last_id, offset): the last processed `_id` stored at `path`
+    and the size in bytes of the output at that point, so that rows
+    written after the checkpoint can be truncated before resuming. With
+    no checkpoint nothing was processed, so this is (None, 0).
+
+    Raises ValueError if the checkpoint was written for another output
+    or source than the given ones.
+    """
+    if not os.path.isfile(path):
+        return None, 0
+    with open(path) as f:
+        checkpoint = json_util.loads(f.read())
+    expected = {'output': None if output is None else os.path.abspath(output),
+                'source': _source_key(source)}
+    for key, value in expected.items():
+        if value is not None and checkpoint.get(key) != value:
+            raise ValueError("Checkpoint {} was written for {} {}".format(
+                path, key, checkpoint.get(key)))
+    return checkpoint['last_id'], checkpoint.get('offset')
+
+
+def write_checkpoint(path, last_id, offset=None, output=None, source=None):
+    tmp = path + '.tmp'
+    with open(tmp, 'w') as f:
+        f.write(json_util.dumps({
+            'last_id': last_id, 'offset': offset,
+            'output': None if output is None else os.path.abspath(output),
+            'source': _source_key(source)}))
+    os.replace(tmp, path)
+
+
+# background info of every row (see SquawkaMatch._background_info)
+BACKGROUND_COLUMNS = ('competition', 'match', 'kickoff', 'team_home',
+                      'team_away', 'goals_home', 'goals_away', 'year')
+# event-level columns (see EventTable.row_columns), also the fields of the
+# events in the `seq` of xG rows
+EVENT_COLUMNS = ('x', 'y', 'end_x', 'end_y', 'mins', 'secs', 'ftype',
+                 'type', 'action_type', 'player_id', 'team_id')
+# attempt features of xG rows (see SquawkaMatch.xGs)
+FEATURE_COLUMNS = ('team_id', 'player_id', 'is_home', 'headed', 'is_goal',
+                   'distance', 'possession', 'angle', 'x', 'y', 'mins',
+                   'secs', 'assist_x', 'assist_y', 'assist_id',
+                   'assist_angle', 'assist_dist', 'attack', 'defend')
+
+
+def _arrow_fields(columns):
+    import pyarrow as pa
+    types = {'kickoff': pa.timestamp('s', tz='UTC'),
+             'is_home': pa.bool_(), 'headed': pa.bool_(),
+             'is_goal': pa.bool_()}
+    for col in ('goals_home', 'goals_away', 'year', 'mins', 'secs',
+                'attack', 'defend'):
+        types[col] = pa.int32()
+    for col in ('x', 'y', 'end_x', 'end_y', 'distance', 'possession',
+                'angle', 'assist_x', 'assist_y', 'assist_angle',
+                'assist_dist'):
+        types[col] = pa.float64()
+    return [(col, types.get(col, pa.string())) for col in columns]
+
+
+def _arrow_schema():
+    import pyarrow as pa
+    seq = pa.struct(_arrow_fields(EVENT_COLUMNS))
+    return pa.schema([('seq', pa.list_(seq))] +
+                     _arrow_fields(BACKGROUND_COLUMNS + FEATURE_COLUMNS))
+
+
+def _event_schema():
+    import pyarrow as pa
+    return pa.schema(_arrow_fields(BACKGROUND_COLUMNS + EVENT_COLUMNS))
+
+
+class CsvWriter(object):
+    """
+    Write xG rows to csv, with `seq` as its python repr. When appending,
+    the output can first be truncated to `truncate` bytes (e.g. to drop
+    rows written after the last checkpoint).
+    """
+    def __init__(self, output, append=False, truncate=None):
+        self.header = None
+        if append and os.path.isfile(output):
+            if truncate is not None:    # never grow the output
+                os.truncate(output, min(truncate, os.path.getsize(output)))
+            with open(output) as f:
+                self.header = next(csv.reader(f), None)
+        self.f = open(output, 'a' if append else 'w')
+        self.writer = csv.writer(self.f)
+
+    def write(self, row):
+        if self.header is None:
+            self.header = list(row.keys())
+            self.writer.writerow(self.header)
+        self.writer.writerow([row[k] for k in self.header])
+
+    def flush(self):
+        self.f.flush()
+
+    def tell(self):
+        return self.f.tell()
+
+    def close(self):
+        self.f.close()
+
+
+class ArrowWriter(object):
+    """
+    Write xG rows to a Parquet or Arrow IPC file with typed columns and
+    `seq` as a list<struct> column. Rows are buffered and written in row
+    groups (record batches) of `row_group_size`. Columns of another
+    `schema` can be written with `write_columns`.
+    """
+    def __init__(self, output, fmt='parquet', row_group_size=10000,
+                 schema=None):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        self.pa, self.fmt = pa, fmt
+        self.schema = schema or _arrow_schema()
+        self.row_group_size = row_group_size
+        self.rows = []
+        if fmt == 'parquet':
+            self.writer = pq.ParquetWriter(output, self.schema)
+        elif fmt == 'arrow':
+            self.writer = pa.ipc.new_file(output, self.schema)
+        else:
+            raise ValueError("Unknown format: {}".format(fmt))
+
+    def write(self, row):
+        seq = []
+        for e in row['seq']:    # missing end coordinates are stored as null
+            e = dict(e)
+            if e['end_x'] == '':
+                e['end_x'], e['end_y'] = None, None
+            seq.append(e)
+        self.rows.append({**row, 'seq': seq})
+        if len(self.rows) >= self.row_group_size:
+            self.flush()
+
+    def write_columns(self, columns):
+        """Write a dict column -> list of values as a row group"""
+        self.flush()
+        self._write_batch(
+            self.pa.RecordBatch.from_pydict(columns, schema=self.schema))
+
+    def _write_batch(self, batch):
+        if self.fmt == 'parquet':
+            self.writer.write_table(self.pa.Table.from_batches([batch]))
+        else:
+            self.writer.write_batch(batch)
+
+    def flush(self):
+        if not self.rows:
+            return
+        self._write_batch(
+            self.pa.RecordBatch.from_pylist(self.rows, schema=self.schema))
+        self.rows = []
+
+    def close(self):
+        self.flush()
+        self.writer.close()
+
+
+def _get_writer(output, fmt='csv', append=False, truncate=None):
+    if fmt == 'csv':
+        return CsvWriter(output, append=append, truncate=truncate)
+    if append:
+        raise ValueError("Appending is only supported for csv output")
+    if fmt == 'sequences':
+        from sequences import SequenceWriter
+        return SequenceWriter(output)
+    return ArrowWriter(output, fmt=fmt)
+
+
+def _doc_xGs(doc, instrument=False):
+    """
+    Compute xG rows for a single document. Runs in the worker processes,
+    so failures are returned as a report instead of raised. If
+    `instrument`, the match stats are returned as a dict (see stats.Stats).
+
+    Returns: (_id, rows, error, stats)
+    """
+    stats = Stats() if instrument else NULL_STATS
+    try:
+        m = SquawkaMatch(doc['data'], path=doc['url'], stats=stats)
+        rows = [{'seq': seq, **bg, **feats} for bg, seq, feats in m.xGs()]
+        return doc['_id'], rows, None, stats.to_dict()
+    except Exception as e:
+        return doc.get('_id'), [], _error_report(doc, e), stats.to_dict()
 
-from squawka_match import SquawkaMatch
 
+def _error_report(doc, e):
+    """Report of a document that failed, to be called in an except block"""
+    return {'_id': str(doc.get('_id')),
+            'url': doc.get('url'),
+            'error': type(e).__name__,
+            'message': str(e),
+            'traceback': traceback.format_exc()}
 
-def _mongo_export_xGs(output='xGs.csv'):
-    client = pymongo.MongoClient()
-    with open(output, 'w') as f:
-        header = None
-        writer = csv.writer(f)
-        for doc in client.squawka.squawka.find():
-            try:
-                m = SquawkaMatch(doc['data'], path=doc['url'])
-                for bg, seq, feats in m.xGs():
-                    row = {'seq': seq, **bg, **feats}
-                    if header is None:
-                        header = list(row.keys())
-                        writer.writerow(header)
-                    writer.writerow([row[k] for k in header])
-            except Exception as e:
-                print("Couldn't parse file: {}".format(doc['url']))
+
+def _map_docs(docs, workers=1, ordered=True, chunksize=4, instrument=False):
+    """
+    Apply _doc_xGs over docs, in a process pool if `workers` > 1.
+    Results are yielded in input order if `ordered`, otherwise as soon
+    as they are ready.
+    """
+    func = functools.partial(_doc_xGs, instrument=instrument)
+    if workers <= 1:
+        yield from map(func, docs)
+        return
+    with Pool(workers) as pool:
+        imap = pool.imap if ordered else pool.imap_unordered
+        yield from imap(func, docs, chunksize)
+
+
+def export_xGs(docs, output='xGs.csv', workers=1, ordered=True,
+               checkpoint=None, checkpoint_every=50, append=False,
+               truncate=None, fmt='csv', stats=None, source=None):
+    """
+    Write xG rows for an iterable of {'_id', 'data', 'url'} documents to
+    a csv file. Documents are parsed in `workers` processes and the rows
+    are streamed back to a single writer.
+
+    Parameters:
+    -----------
+    checkpoint: str, path where the last written `_id` and the output
+        offset are persisted every `checkpoint_every` documents (requires
+        `ordered`)
+    append: bool, append to an existing output (e.g. when resuming)
+    truncate: int, when appending, truncate the output to this offset
+        first (see read_checkpoint)
+    source: str, jsonl path or Mongo uri of the documents, stored in the
+        checkpoint so that it isn't resumed from another source
+    fmt: str, output format, one of 'csv', 'parquet', 'arrow' or
+        'sequences' (a directory of sequence tensors, see sequences.py)
+    stats: stats.Stats, if given, per-stage timers and counters of all
+        documents and of the writer are aggregated into it
+
+    Returns: list of error reports of the documents that failed
+    """
+    if checkpoint is not None and not ordered:
+        raise ValueError("Checkpointing requires ordered output")
+    if checkpoint is not None and fmt != 'csv':
+        raise ValueError("Checkpointing is only supported for csv output")
+    failures, idx, _id = [], None, None
+    instrument = stats is not None
+    stats = stats if instrument else NULL_STATS
+    writer = _get_writer(output, fmt=fmt, append=append, truncate=truncate)
+    try:
+        results = _map_docs(docs, workers, ordered, instrument=instrument)
+        for idx, (_id, rows, error, doc_stats) in enumerate(results):
+            stats.update(doc_stats)
+            stats.incr('docs')
+            if error is not None:
+                failures.append(error)
+                stats.incr('failures[{}]'.format(error['error']))
+            with stats.timer('write'):
+                for row in rows:
+                    writer.write(row)
+            stats.incr('rows_written', len(rows))
+            if checkpoint is not None and (idx + 1) % checkpoint_every == 0:
+                writer.flush()  # never checkpoint ahead of the output
+                write_checkpoint(checkpoint, _id, writer.tell(),
+                                 output=output, source=source)
+        if checkpoint is not None and idx is not None:
+            writer.flush()
+            write_checkpoint(checkpoint, _id, writer.tell(),
+                             output=output, source=source)
+    finally:
+        writer.close()
+    return failures
+
+
+def write_event_batches(batches, output, fmt='csv'):
+    """
+    Write event-level column chunks (see squawka_match.event_batches) to
+    csv, parquet or arrow without building per-row dicts. The output is
+    created (with its header or schema) even if there are no rows.
+
+    Returns: number of written rows
+    """
+    columns = BACKGROUND_COLUMNS + EVENT_COLUMNS
+    n_rows = 0
+    if fmt == 'csv':
+        with open(output, 'w') as f:
+            writer = csv.writer(f)
+            writer.writerow(columns)
+            for batch in batches:
+                writer.writerows(zip(*(batch[col] for col in columns)))
+                n_rows += len(batch['x'])
+        return n_rows
+    writer = ArrowWriter(output, fmt=fmt, schema=_event_schema())
+    try:
+        for batch in batches:
+            for key in ('end_x', 'end_y'):   # missing ends as null
+                batch[key] = [None if v == '' else v for v in batch[key]]
+            writer.write_columns(batch)
+            n_rows += len(batch['x'])
+    finally:
+        writer.close()
+    return n_rows
+
+
+def _doc_matches(docs, failures):
+    """Parse documents, appending error reports of failures to `failures`"""
+    for doc in docs:
+        try:
+            yield SquawkaMatch(doc['data'], path=doc['url'])
+        except Exception as e:
+            failures.append(_error_report(doc, e))
+
+
+def export_events(docs, output='events.csv', fmt='csv', batch_size=10000):
+    """
+    Write event-level rows of the documents in chunks of `batch_size`.
+
+    Returns: (number of written rows, list of error reports of the
+        documents that failed)
+    """
+    failures = []
+    n_rows = write_event_batches(
+        event_batches(_doc_matches(docs, failures), batch_size=batch_size),
+        output, fmt=fmt)
+    return n_rows, failures
+
+
+def _doc_key(doc):
+    """Manifest key of a document: <competition>/<match_id>"""
+    return '{}/{}'.format(*_path_ids(doc['url']))
+
+
+def _content_hash(data):
+    if isinstance(data, str):
+        data = data.encode('utf')
+    return hashlib.sha1(data).hexdigest()
+
+
+class ExportManifest(object):
+    """
+    Record of the matches exported to a directory of output shards: per
+    <competition>/<match_id>, the content hash of the source xml, the
+    parser and features versions and the shard holding its rows.
+    """
+    def __init__(self, dirpath):
+        self.dirpath = dirpath
+        self.path = os.path.join(dirpath, MANIFEST)
+        os.makedirs(dirpath, exist_ok=True)
+        self.matches = {}
+        if os.path.isfile(self.path):
+            with open(self.path) as f:
+                self.matches = json.load(f)['matches']
+
+    def is_current(self, key, digest):
+        entry = self.matches.get(key)
+        return entry is not None and entry['hash'] == digest and \
+            entry['parser_version'] == PARSER_VERSION and \
+            entry['features_version'] == FEATURES_VERSION
+
+    def set(self, key, digest, shard):
+        self.matches[key] = {'hash': digest, 'shard': shard,
+                             'parser_version': PARSER_VERSION,
+                             'features_version': FEATURES_VERSION}
+
+    def shards(self):
+        """Existing shard files in the directory"""
+        return sorted(f for f in os.listdir(self.dirpath) if SHARD_RE.match(f))
+
+    def next_shard(self, fmt):
+        numbers = [int(SHARD_RE.match(f).group(1)) for f in self.shards()]
+        return SHARD.format(max(numbers, default=-1) + 1, fmt)
+
+    def remove_orphans(self):
+        """Remove shards (e.g. of interrupted runs) missing in the manifest"""
+        referenced = {e['shard'] for e in self.matches.values()}
+        for shard in self.shards():
+            if shard not in referenced:
+                os.remove(os.path.join(self.dirpath, shard))
+
+    def save(self):
+        tmp = self.path + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump({'matches': self.matches}, f, indent=1, sort_keys=True)
+        os.replace(tmp, self.path)
+
+
+def _drop_matches(path, fmt, keys):
+    """
+    Rewrite a shard without the rows of the given matches. Returns the
+    number of remaining rows (the shard is removed if none remain).
+    """
+    tmp = path + '.tmp'
+    if fmt == 'csv':
+        n_rows = 0
+        with open(path) as f, open(tmp, 'w') as out:
+            reader, writer = csv.reader(f), csv.writer(out)
+            header = next(reader)
+            writer.writerow(header)
+            comp, match = header.index('competition'), header.index('match')
+            for row in reader:
+                if '{}/{}'.format(row[comp], row[match]) not in keys:
+                    writer.writerow(row)
+                    n_rows += 1
+    else:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        if fmt == 'parquet':
+            table = pq.read_table(path)
+        else:
+            with pa.ipc.open_file(path) as reader:
+                table = reader.read_all()
+        table = table.filter(pa.array([
+            '{}/{}'.format(comp, match) not in keys for comp, match in zip(
+                table['competition'].to_pylist(),
+                table['match'].to_pylist())]))
+        n_rows = table.num_rows
+        if fmt == 'parquet':
+            pq.write_table(table, tmp)
+        else:
+            with pa.ipc.new_file(tmp, table.schema) as writer:
+                writer.write_table(table)
+    if n_rows:
+        os.replace(tmp, path)
+    else:
+        os.remove(tmp)
+        os.remove(path)
+    return n_rows
+
+
+def export_incremental(docs, output='xGs', workers=1, ordered=True,
+                       fmt='csv', stats=None):
+    """
+    Incrementally export xG rows to a directory of shards, tracked by an
+    ExportManifest. Documents whose source xml and parser/features
+    versions are unchanged since the last run are skipped without being
+    parsed. New and changed matches are written to a fresh shard, and the
+    stale rows of changed matches are dropped from their old shards.
+
+    Returns: list of error reports of the documents that failed (these
+        are not recorded in the manifest, so they are retried next time)
+    """
+    if fmt not in ('csv', 'parquet', 'arrow'):
+        raise ValueError("Unsupported format for shards: {}".format(fmt))
+    instrument = stats is not None
+    stats = stats if instrument else NULL_STATS
+    manifest = ExportManifest(output)
+    manifest.remove_orphans()
+    shard = manifest.next_shard(fmt)
+    path = os.path.join(output, shard)
+    todo, done, failures = {}, {}, []
+
+    def changed_docs():
+        for doc in docs:
+            key, digest = _doc_key(doc), _content_hash(doc['data'])
+            if manifest.is_current(key, digest):
+                stats.incr('skipped')
+                continue
+            todo[doc['_id']] = key, digest
+            yield doc
+
+    writer = None
+    try:
+        results = _map_docs(changed_docs(), workers, ordered,
+                            instrument=instrument)
+        for _id, rows, error, doc_stats in results:
+            stats.update(doc_stats)
+            stats.incr('docs')
+            key, digest = todo.pop(_id)
+            if error is not None:
+                failures.append(error)
+                stats.incr('failures[{}]'.format(error['error']))
+                continue
+            with stats.timer('write'):
+                if rows and writer is None:
+                    writer = _get_writer(path + '.tmp', fmt=fmt)
+                for row in rows:
+                    writer.write(row)
+            stats.incr('rows_written', len(rows))
+            done[key] = digest, bool(rows)
+    finally:
+        if writer is not None:
+            writer.close()
+    if writer is not None:
+        os.replace(path + '.tmp', path)
+    # drop stale rows of re-exported matches from their old shards
+    stale = {}
+    for key in done:
+        entry = manifest.matches.get(key)
+        if entry is not None and entry['shard'] is not None:
+            stale.setdefault(entry['shard'], set()).add(key)
+    for old_shard, keys in stale.items():
+        old_path = os.path.join(output, old_shard)
+        if os.path.isfile(old_path):
+            stats.incr('shards_rewritten')
+            _drop_matches(old_path, SHARD_RE.match(old_shard).group(2), keys)
+    for key, (digest, has_rows) in done.items():
+        manifest.set(key, digest, shard if has_rows else None)
+    manifest.save()
+    return failures
+
+
+def _mongo_export_xGs(output='xGs.csv', workers=1, ordered=True,
+                      errors=None, source='mongodb://localhost:27017',
+                      batch_size=100, checkpoint=None, resume=False,
+                      fmt='csv', stats=None, incremental=False):
+    """
+    Export xGs from a Mongo collection (squawka.squawka at the `source`
+    uri) or from a local jsonl dump if `source` is a file. If `resume`,
+    continue after the last `_id` stored in `checkpoint`, dropping the
+    rows written after it. If `stats` is
+    a path, the aggregated stats of the run are dumped there as json.
+    If `incremental`, `output` is a directory of shards (see
+    export_incremental) and checkpoints are not used.
+    """
+    start_after, offset = None, None
+    if resume:
+        if checkpoint is None:
+            raise ValueError("Resuming needs a checkpoint")
+        start_after, offset = read_checkpoint(
+            checkpoint, output=output, source=source)
+    docs = _source_docs(source, batch_size=batch_size,
+                        start_after=start_after)
+    run_stats = Stats() if stats is not None else None
+    if incremental:
+        failures = export_incremental(docs, output=output, workers=workers,
+                                      ordered=ordered, fmt=fmt,
+                                      stats=run_stats)
+    else:
+        failures = export_xGs(docs, output=output, workers=workers,
+                              ordered=ordered, checkpoint=checkpoint,
+                              append=resume, truncate=offset, fmt=fmt,
+                              stats=run_stats, source=source)
+    if failures:
+        print("Couldn't parse {} files".format(len(failures)))
+    if run_stats is not None:
+        print(run_stats.report())
+        run_stats.dump(stats)
+    if errors is not None:
+        _write_errors(errors, failures, append=resume)
+    return failures
+
+
+def _source_docs(source, batch_size=100, start_after=None):
+    """Documents of a Mongo uri (squawka.squawka) or of a jsonl dump"""
+    if os.path.isfile(source):
+        return jsonl_docs(source, start_after=start_after)
+    client = pymongo.MongoClient(source)
+    return mongo_docs(client.squawka.squawka, batch_size=batch_size,
+                      start_after=start_after)
+
+
+def _write_errors(path, failures, append=False):
+    with open(path, 'a' if append else 'w') as f:
+        for failure in failures:
+            f.write(json.dumps(failure) + '\n')
+
+
+def _mongo_export_events(output='events.csv', fmt='csv', errors=None,
+                         source='mongodb://localhost:27017',
+                         batch_size=100):
+    """Export event-level rows from a Mongo collection or a jsonl dump"""
+    n_rows, failures = export_events(
+        _source_docs(source, batch_size=batch_size), output=output, fmt=fmt)
+    print("Wrote {} rows".format(n_rows))
+    if failures:
+        print("Couldn't parse {} files".format(len(failures)))
+    if errors is not None:
+        _write_errors(errors, failures)
+    return failures
 
 
 if __name__ == '__main__':
     import argparse
     parser = argparse.ArgumentParser()
     parser.add_argument('--output', default='xGs.csv')
+    parser.add_argument('--format', default='csv',
+                        choices=('csv', 'parquet', 'arrow', 'sequences'))
+    parser.add_argument('--workers', type=int, default=1)
+    parser.add_argument('--unordered', action='store_true',
+                        help='Write rows as soon as documents are done')
+    parser.add_argument('--errors', help='Path to a jsonl error report')
+    parser.add_argument('--source', default='mongodb://localhost:27017',
+                        help='Mongo uri or path to a local jsonl dump')
+    parser.add_argument('--batch_size', type=int, default=100)
+    parser.add_argument('--checkpoint',
+                        help='Defaults to <output>.checkpoint')
+    parser.add_argument('--resume', action='store_true')
+    parser.add_argument('--stats',
+                        help='Dump per-stage timers and counters to a json')
+    parser.add_argument('--incremental', action='store_true',
+                        help='Export only new or changed matches to shards '
+                        'in the output directory')
+    parser.add_argument('--events', action='store_true',
+                        help='Export event-level rows instead of xGs')
     args = parser.parse_args()
 
-    _mongo_export_xGs(output=args.output)
+    if args.events:
+        _mongo_export_events(output=args.output, fmt=args.format,
+                             errors=args.errors, source=args.source,
+                             batch_size=args.batch_size)
+        raise SystemExit
+    checkpoint = args.checkpoint or args.output + '.checkpoint'
+    if args.unordered or args.format != 'csv' or args.incremental:
+        checkpoint = None
+
+    _mongo_export_xGs(output=args.output, workers=args.workers,
+                      ordered=not args.unordered, errors=args.errors,
+                      source=args.source, batch_size=args.batch_size,
+                      checkpoint=checkpoint, resume=args.resume,
+                      fmt=args.format, stats=args.stats,
+                      incremental=args.incremental)
@@ -0,0 +1,398 @@
+import asyncio
+import gzip
+import hashlib
+import json
+import os
+import random
+import threading
+import zlib
+from email.utils import formatdate
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit
+
+from squawka_match import COMP_ID_RE
+from stats import Stats
+
+URL = 'http://s3-irl-{competition}.squawka.com/dp/ingame/{match_id}'
+MANIFEST = '.squawka_fetch.json'
+RETRY_STATUS = (429, 500, 502, 503, 504)
+
+
+class FetchError(Exception):
+    pass
+
+
+class ResponseError(FetchError):
+    """Malformed HTTP response (retried as a transient failure)"""
+    pass
+
+
+def match_ids(competition, start, stop):
+    """(competition, match_id) pairs for a range of match ids"""
+    return [(competition, str(match_id)) for match_id in range(start, stop)]
+
+
+class _Connection(object):
+    def __init__(self, reader, writer):
+        self.reader, self.writer = reader, writer
+        self.reused = False
+
+    def close(self):
+        self.writer.close()
+
+
+class _Pool(object):
+    """Keep-alive connections to a host, at most `size` open at once"""
+    def __init__(self, host, port, size):
+        self.host, self.port = host, port
+        self.idle = []
+        self.slots = asyncio.Semaphore(size)
+
+    async def acquire(self):
+        await self.slots.acquire()
+        if self.idle:
+            conn = self.idle.pop()
+            conn.reused = True
+            return conn
+        try:
+            return _Connection(
+                *await asyncio.open_connection(self.host, self.port))
+        except BaseException:
+            self.slots.release()
+            raise
+
+    def release(self, conn, reuse=True):
+        if reuse:
+            self.idle.append(conn)
+        else:
+            conn.close()
+        self.slots.release()
+
+    def close(self):
+        for conn in self.idle:
+            conn.close()
+        self.idle = []
+
+
+async def _read_body(reader, headers):
+    if headers.get('transfer-encoding', '').lower() == 'chunked':
+        chunks = []
+        while True:
+            line = await reader.readline()
+            try:
+                size = int(line.split(b';')[0], 16)
+            except ValueError:
+                raise ResponseError("Malformed chunk size: {!r}".format(
+                    line[:80]))
+            if size == 0:
+                while (await reader.readline()) not in (b'\r\n', b''):
+                    pass        # trailers
+                return b''.join(chunks), True
+            chunks.append(await reader.readexactly(size))
+            await reader.readexactly(2)
+    if 'content-length' in headers:
+        return await reader.readexactly(int(headers['content-length'])), True
+    return await reader.read(), False   # delimited by connection close
+
+
+async def _request(conn, host, path, headers):
+    """
+    Send a GET request over a keep-alive connection.
+
+    Returns: (status, headers, body, reusable)
+    """
+    lines = ['GET {} HTTP/1.1'.format(path), 'Host: {}'.format(host),
+             'Connection: keep-alive', 'Accept-Encoding: gzip, deflate']
+    lines += ['{}: {}'.format(k, v) for k, v in headers.items()]
+    conn.writer.write(('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1'))
+    await conn.writer.drain()
+    status_line = await conn.reader.readline()
+    if not status_line:
+        raise ConnectionResetError("Connection closed by server")
+    try:
+        status = int(status_line.split()[1])
+    except (IndexError, ValueError):
+        raise ResponseError("Malformed status line: {!r}".format(
+            status_line[:80]))
+    resp_headers = {}
+    while True:
+        line = await conn.reader.readline()
+        if line in (b'\r\n', b''):
+            break
+        key, _, value = line.decode('latin-1').partition(':')
+        resp_headers[key.strip().lower()] = value.strip()
+    if status in (204, 304) or 100 <= status < 200:
+        body, reusable = b'', True
+    else:
+        body, reusable = await _read_body(conn.reader, resp_headers)
+    encoding = resp_headers.get('content-encoding', '').lower()
+    try:
+        if encoding == 'gzip':
+            body = gzip.decompress(body)
+        elif encoding == 'deflate':
+            body = zlib.decompress(body)
+    except (OSError, EOFError, zlib.error) as e:
+        raise ResponseError("Couldn't decode {} body: {}".format(encoding, e))
+    if resp_headers.get('connection', '').lower() == 'close':
+        reusable = False
+    return status, resp_headers, body, reusable
+
+
+class Fetcher(object):
+    """
+    Asynchronous bulk downloader of squawka match xmls into a directory,
+    as <competition>_<match_id>.xml files that SquawkaMatch, MatchCatalog
+    or MatchCollection can read.
+
+    Requests go through pools of keep-alive connections per host, with
+    at most `concurrency` requests in flight. Connection errors and
+    transient statuses (see RETRY_STATUS) are retried with exponential
+    backoff. ETag and Last-Modified of every download are kept in a
+    manifest in the directory and sent back as conditional headers, so
+    that unchanged matches are skipped (304) on the next run.
+
+    Parameters:
+    -----------
+    dirpath: str, output directory (created if needed)
+    url_template: str, match url with {competition} and {match_id} fields
+    concurrency: int, maximum number of concurrent requests
+    per_host: int, maximum number of connections per host
+    retries: int, maximum number of retries per match
+    backoff: float, initial backoff in seconds (doubled on every retry)
+    timeout: float, timeout of a single request in seconds
+    """
+    def __init__(self, dirpath, url_template=URL, concurrency=16,
+                 per_host=8, retries=3, backoff=0.5, timeout=30,
+                 stats=None):
+        self.dirpath = dirpath
+        self.url_template = url_template
+        self.concurrency, self.per_host = concurrency, per_host
+        self.retries, self.backoff, self.timeout = retries, backoff, timeout
+        self.stats = stats or Stats()
+        self.manifest_path = os.path.join(dirpath, MANIFEST)
+        os.makedirs(dirpath, exist_ok=True)
+        self.manifest = {}
+        if os.path.isfile(self.manifest_path):
+            with open(self.manifest_path) as f:
+                self.manifest = json.load(f)
+        self._pools = {}
+
+    def _pool(self, host, port):
+        if (host, port) not in self._pools:
+            self._pools[host, port] = _Pool(host, port, self.per_host)
+        return self._pools[host, port]
+
+    def _conditional_headers(self, filename):
+        entry = self.manifest.get(filename)
+        if entry is None or \
+           not os.path.isfile(os.path.join(self.dirpath, filename)):
+            return {}
+        headers = {}
+        if entry.get('etag'):
+            headers['If-None-Match'] = entry['etag']
+        if entry.get('last_modified'):
+            headers['If-Modified-Since'] = entry['last_modified']
+        return headers
+
+    def _write(self, filename, data):
+        path = os.path.join(self.dirpath, filename)
+        tmp = '{}.{}.tmp'.format(path, os.getpid())
+        with open(tmp, 'wb') as f:
+            f.write(data)
+        os.replace(tmp, path)
+
+    def save_manifest(self):
+        tmp = self.manifest_path + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(self.manifest, f, indent=1, sort_keys=True)
+        os.replace(tmp, self.manifest_path)
+
+    async def _get(self, url, headers):
+        parts = urlsplit(url)
+        if parts.scheme != 'http':
+            raise FetchError("Unsupported scheme: {}".format(parts.scheme))
+        host, port = parts.hostname, parts.port or 80
+        path = parts.path + ('?' + parts.query if parts.query else '')
+        pool = self._pool(host, port)
+        while True:
+            conn = await pool.acquire()
+            reusable = False
+            try:
+                status, resp_headers, body, reusable = await asyncio.wait_for(
+                    _request(conn, parts.netloc, path, headers), self.timeout)
+                return status, resp_headers, body
+            except (ConnectionError, asyncio.IncompleteReadError):
+                # idle connections may have been closed by the server
+                if not conn.reused:
+                    raise
+            finally:
+                pool.release(conn, reuse=reusable)
+
+    async def fetch(self, competition, match_id):
+        """
+        Download a single match, retrying transient failures.
+
+        Returns: str, one of 'fetched', 'not_modified' or 'missing'
+        """
+        url = self.url_template.format(
+            competition=competition, match_id=match_id)
+        filename = '{}_{}.xml'.format(competition, match_id)
+        headers = self._conditional_headers(filename)
+        for attempt in range(self.retries + 1):
+            if attempt > 0:
+                self.stats.incr('retries')
+                delay = self.backoff * 2 ** (attempt - 1)
+                await asyncio.sleep(delay * (1 + random.random() / 2))
+            try:
+                with self.stats.timer('request'):
+                    status, resp_headers, body = await self._get(url, headers)
+            except ResponseError as e:
+                error = e
+                continue
+            except (OSError, asyncio.IncompleteReadError,
+                    asyncio.TimeoutError, ValueError) as e:
+                error = FetchError("{}: {}".format(type(e).__name__, e))
+                continue
+            if status in RETRY_STATUS:
+                error = FetchError("HTTP {}".format(status))
+                continue
+            if status == 304:
+                return 'not_modified'
+            if status == 404:
+                return 'missing'
+            if status != 200:
+                raise FetchError("HTTP {}".format(status))
+            self._write(filename, body)
+            self.stats.incr('bytes', len(body))
+            self.manifest[filename] = {
+                'url': url, 'etag': resp_headers.get('etag'),
+                'last_modified': resp_headers.get('last-modified')}
+            return 'fetched'
+        raise error
+
+    async def fetch_all(self, ids):
+        """
+        Download all (competition, match_id) pairs in `ids` with at most
+        `concurrency` concurrent requests.
+
+        Returns: dict with the outcome of every pair (or the error)
+        """
+        queue = asyncio.Queue()
+        for pair in ids:
+            queue.put_nowait(pair)
+        results = {}
+
+        async def worker():
+            while not queue.empty():
+                competition, match_id = queue.get_nowait()
+                try:
+                    outcome = await self.fetch(competition, match_id)
+                except Exception as e:
+                    # record the match as failed, without stopping the run
+                    outcome = 'failed'
+                    if not isinstance(e, FetchError):
+                        e = FetchError("{}: {}".format(type(e).__name__, e))
+                    print("Couldn't fetch {}_{}: {}".format(
+                        competition, match_id, e))
+                self.stats.incr(outcome)
+                results[competition, match_id] = outcome
+
+        try:
+            await asyncio.gather(
+                *(worker() for _ in range(self.concurrency)))
+        finally:
+            for pool in self._pools.values():
+                pool.close()
+            self._pools = {}
+            self.save_manifest()
+        return results
+
+    def run(self, ids):
+        """Blocking version of `fetch_all`"""
+        return asyncio.run(self.fetch_all(ids))
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    """
+    Keep-alive handler serving the <competition>_<match_id>.xml files of
+    `server.dirpath` at /<competition>/ingame/<match_id>, with ETag and
+    Last-Modified validators and gzip encoding. Every `server.fail_every`
+    requests a 503 is returned instead, to exercise retries.
+    """
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        server = self.server
+        with server.lock:
+            server.requests += 1
+            fail = server.fail_every and \
+                server.requests % server.fail_every == 0
+        if fail:
+            return self._respond(503)
+        parts = self.path.strip('/').split('/')
+        if len(parts) != 3 or parts[1] != 'ingame':
+            return self._respond(404)
+        filename = '{}_{}.xml'.format(parts[0], parts[2])
+        path = os.path.join(server.dirpath, filename)
+        if not COMP_ID_RE.match(filename) or not os.path.isfile(path):
+            return self._respond(404)
+        with open(path, 'rb') as f:
+            data = f.read()
+        etag = '"{}"'.format(hashlib.sha1(data).hexdigest())
+        headers = {'ETag': etag, 'Last-Modified': formatdate(
+            os.stat(path).st_mtime, usegmt=True)}
+        if self.headers.get('If-None-Match') == etag:
+            return self._respond(304, headers)
+        if 'gzip' in self.headers.get('Accept-Encoding', ''):
+            data = gzip.compress(data)
+            headers['Content-Encoding'] = 'gzip'
+        self._respond(200, headers, data)
+
+    def _respond(self, status, headers=None, body=b''):
+        self.send_response(status)
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        if status != 304:
+            self.send_header('Content-Type', 'application/xml')
+            self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        if status != 304:
+            self.wfile.write(body)
+
+
+def serve_dir(dirpath, host='127.0.0.1', port=0, fail_every=0):
+    """
+    Start a local stand-in for the squawka servers (see StandInHandler)
+    in a background thread. Use server.server_address for the bound port
+    and server.shutdown() to stop it.
+    """
+    server = ThreadingHTTPServer((host, port), StandInHandler)
+    server.daemon_threads = True
+    server.dirpath, server.fail_every = dirpath, fail_every
+    server.requests, server.lock = 0, threading.Lock()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(
+        description='Download squawka matches into a directory')
+    parser.add_argument('dirpath')
+    parser.add_argument('competition')
+    parser.add_argument('start', type=int, help='First match id')
+    parser.add_argument('stop', type=int, help='Last match id (exclusive)')
+    parser.add_argument('--url_template', default=URL)
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--per_host', type=int, default=8)
+    parser.add_argument('--retries', type=int, default=3)
+    args = parser.parse_args()
+
+    fetcher = Fetcher(args.dirpath, url_template=args.url_template,
+                      concurrency=args.concurrency, per_host=args.per_host,
+                      retries=args.retries)
+    fetcher.run(match_ids(args.competition, args.start, args.stop))
+    print(fetcher.stats.report())
@@ -0,0 +1,210 @@
+import bisect
+
+from lxml import etree
+import numpy as np
+
+from utils import TIME_SLICE_EVENTS
+from events import Event, FTYPE_IDS
+from squawka_match import TS_RE, GAME, PLAYERS, FILTERS
+from squawka_match import _open_source, _path_ids, _filter_type, _parse_node
+from squawka_match import _parse_game, _parse_possession, _maybe_flip
+from squawka_match import _xpath
+from squawka_match import _xG_rows, _background_info, _score_at
+from squawka_match import _team_possessions
+from stats import NULL_STATS
+import utils
+
+
+def _iterparse_since(source, seen):
+    """
+    Stream a squawka xml snapshot, parsing only the filter events that
+    weren't in previous snapshots. `seen` maps (filter, time slice) to the
+    number of events already parsed, which is updated in place. Events
+    are assumed to be appended to their time slice. Slices without new
+    events are skipped by their size and seen events are never visited,
+    so the python work is proportional to the new events and the number
+    of time slices (the xml itself is still tokenized by lxml).
+
+    Returns: (root, new), where `new` is a list of
+        (ftype, slice start, position in slice, Event)
+    """
+    new = []
+    context = etree.iterparse(source, events=('end',), tag='time_slice')
+    for _, node in context:
+        ftype = _filter_type(node)
+        if ftype is None or ftype not in TIME_SLICE_EVENTS:
+            continue
+        name = node.attrib['name']
+        n_seen = seen.get((ftype, name), 0)
+        if len(node) > n_seen:
+            ts0, ts1 = TS_RE.match(name).groups()
+            ts = int(ts0), int(ts1)
+            for pos, child in enumerate(node[n_seen:], n_seen):
+                if child.tag == 'event':
+                    new.append((ftype, ts[0], pos, Event.from_dict(
+                        _parse_node(child), ftype=ftype, ts=ts)))
+            seen[ftype, name] = len(node)
+        node.clear()            # drop processed time slice with its events
+        node.getparent().remove(node)
+    return context.root, new
+
+
+class LiveMatch(object):
+    """
+    Incremental version of SquawkaMatch for matches that are being played.
+    Each call to `update` takes a new snapshot of the (growing) match xml,
+    parses only the events that are new since the previous snapshot and
+    returns the xG rows (see SquawkaMatch.xGs) of the attempts that were
+    completed in the meantime.
+
+    The latest time slice of a snapshot is considered open: attempts are
+    only completed once a later time slice appears (or after `finish`),
+    since the events leading to them may still be missing. Events arriving
+    after the attempt closing their possession chain was completed are
+    ignored for the attempts, but kept in `events`.
+
+    Parameters:
+    -----------
+    path: str, path or url of the match, as in SquawkaMatch
+    filter_goals, breaks: see SquawkaMatch.get_attempts
+    stats: stats.Stats, optional instrumentation
+    """
+    def __init__(self, path, filter_goals=False, breaks=1, stats=None):
+        self.path = path
+        self.filter_goals, self.breaks = filter_goals, breaks
+        self.stats = stats or NULL_STATS
+        self.competition, self.match_id = _path_ids(path)
+        self.game, self.players, self.filters = None, {}, []
+        self.possession = None
+        self.events = []        # all parsed (ftype, event), by arrival
+        self._seen = {}
+        # timed events after the last completed attempt, sorted by key
+        self._pending, self._last_key = [], None
+        self._watermark = -1    # start (in secs) of the open time slice
+        self._goal_times, self._goal_home = [], []
+        self._score = [0, 0]
+
+    @property
+    def team_home(self):
+        return self.game['teams'][self.game['home']]
+
+    @property
+    def team_away(self):
+        return self.game['teams'][self.game['away']]
+
+    @property
+    def score(self):
+        return tuple(self._score)
+
+    @property
+    def score_timeline(self):
+        """Goal times and home scores so far (see SquawkaMatch)"""
+        return (np.array(self._goal_times, dtype=int),
+                np.concatenate([[0], np.cumsum(self._goal_home, dtype=int)]))
+
+    def _background_info(self):
+        return _background_info(
+            self.competition, self.match_id, self.game['kickoff'],
+            self.team_home['id'], self.team_away['id'], self.score)
+
+    def _key(self, ftype, ts0, pos, e):
+        """Sort key reproducing the (stable) time order of EventTable"""
+        return (e.mins, e.secs, self.filters.index(ftype), ts0, pos)
+
+    def _add(self, ftype, ts0, pos, e):
+        self.events.append((ftype, e))
+        if ftype == 'goals_attempts' and e.type == 'goal':
+            is_home = e.team == self.game['home']
+            if is_home or e.team == self.game['away']:
+                self._score[0 if is_home else 1] += 1
+            if e.mins is not None and e.secs is not None:
+                t = e.mins * 60 + e.secs
+                idx = bisect.bisect_right(self._goal_times, t)
+                self._goal_times.insert(idx, t)
+                self._goal_home.insert(idx, is_home)
+        if e.mins is None or e.secs is None:
+            return
+        key = self._key(ftype, ts0, pos, e)
+        if self._last_key is not None and key < self._last_key:
+            self.stats.incr('late_events')
+            return
+        bisect.insort(self._pending, (key, ftype, e))
+
+    def update(self, path_or_string):
+        """
+        Ingest a new snapshot of the match (path, str, bytes or binary
+        file-like, see SquawkaMatch).
+
+        Returns: list of (bg, seq, feats) of the newly completed attempts
+        """
+        source, _ = _open_source(path_or_string, path=self.path)
+        with self.stats.timer('parse'):
+            root, new = _iterparse_since(source, self._seen)
+        self.stats.incr('polls')
+        self.stats.incr('events_parsed', len(new))
+        with self.stats.timer('xpath_extract'):
+            if self.game is None:
+                self.game = _parse_game(_xpath(GAME, root, self.stats)[0])
+            for node in _xpath(PLAYERS, root, self.stats):
+                player = _parse_node(node)
+                self.players[player['id']] = player
+            self.possession = _parse_possession(
+                root, [self.game['home'], self.game['away']],
+                stats=self.stats)
+            self.filters = [
+                c.tag for c in _xpath(FILTERS, root, self.stats)[0]]
+        for ftype, ts0, pos, e in new:
+            self._add(ftype, ts0, pos, e)
+            self._watermark = max(self._watermark, ts0 * 60)
+        return self._complete(self._watermark)
+
+    def finish(self):
+        """Close the match, completing the attempts of the last slice"""
+        return self._complete(float('inf'))
+
+    def _complete(self, watermark):
+        """Segment and featurize the pending attempts before `watermark`"""
+        with self.stats.timer('segmentation'):
+            attempts, start = [], 0
+            for pos, (key, ftype, e) in enumerate(self._pending):
+                if e.mins * 60 + e.secs >= watermark:
+                    break
+                if ftype != 'goals_attempts':
+                    continue
+                attempt = self._attempt(self._pending[start:pos], e)
+                if not self.filter_goals or e.type == 'goal':
+                    attempts.append(attempt)
+                start, self._last_key = pos + 1, key
+            del self._pending[:start]
+        self.stats.incr('attempts', len(attempts))
+        if not attempts:
+            return []
+        return list(_xG_rows(
+            attempts, self._background_info(), self.team_home['id'],
+            self.results, self.possessions, stats=self.stats))
+
+    def _attempt(self, chain, ga):
+        """
+        Events of a possession chain leading to the attempt `ga`, as in
+        SquawkaMatch.get_attempts (breaks are counted backwards from it).
+        """
+        team_id, attempt, breaks = utils.get_team_id(ga), [], 0
+        heat_maps = FTYPE_IDS['extra_heat_maps']
+        for _, ftype, e in reversed(chain):
+            breaks += e.team != ga.team
+            if breaks > self.breaks:
+                break
+            if e.ftype == heat_maps or not e.located:
+                continue
+            attempt.append((ftype, _maybe_flip(ftype, e, team_id)))
+        attempt.reverse()
+        return attempt + [('goals_attempts', ga)]
+
+    def results(self, mins, secs):
+        """Score (home, away) right before each time (see SquawkaMatch)"""
+        return _score_at(self.score_timeline, mins, secs)
+
+    def possessions(self, mins, secs, team_ids, injurytime=None):
+        """Possession at each time (see SquawkaMatch.possessions)"""
+        return _team_possessions(
+            self.possession, mins, secs, team_ids, injurytime=injurytime)
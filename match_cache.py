@@ -0,0 +1,137 @@
+import hashlib
+import io
+import os
+import pickle
+import time
+from collections import defaultdict
+
+SUFFIX = '.pkl'
+# caches shared per directory (see get_cache)
+_CACHES = {}
+
+
+def _read_bytes(source):
+    if isinstance(source, str):
+        with open(source, 'rb') as f:
+            return f.read()
+    return source.read()
+
+
+class MatchCache(object):
+    """
+    On-disk cache of parsed matches. Entries are pickled parsed matches
+    keyed by a hash of the source xml bytes and the parser version, so
+    that changes to either invalidate them. Least recently used entries
+    are evicted when the cache grows over `max_bytes`. The total size is
+    tracked in memory, so the directory is only scanned when it's over
+    budget (entries added by other processes are counted then).
+
+    Hits, misses and load times are kept per instance: share one cache
+    across matches (see get_cache) to get them for a whole run.
+
+    Parameters:
+    -----------
+    dirpath: str, cache directory (created if needed)
+    max_bytes: int, maximum total size of the cached entries
+    """
+    def __init__(self, dirpath, max_bytes=2 * 1024 ** 3):
+        self.dirpath = dirpath
+        self.max_bytes = max_bytes
+        self.stats = defaultdict(float)
+        os.makedirs(dirpath, exist_ok=True)
+        self.size = sum(size for _, size, _ in self._entries())
+
+    @staticmethod
+    def key(data, version):
+        h = hashlib.sha1(str(version).encode())
+        h.update(data)
+        return h.hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.dirpath, key + SUFFIX)
+
+    def get(self, key):
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as f:
+                parsed = pickle.load(f)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            return None
+        os.utime(path)          # mark as recently used
+        return parsed
+
+    def put(self, key, parsed):
+        path = self._path(key)
+        tmp = '{}.{}.tmp'.format(path, os.getpid())
+        with open(tmp, 'wb') as f:
+            pickle.dump(parsed, f, protocol=pickle.HIGHEST_PROTOCOL)
+            size = f.tell()
+        try:
+            size -= os.path.getsize(path)   # replaced entry
+        except OSError:
+            pass
+        os.replace(tmp, path)   # atomic, safe with concurrent writers
+        self.size += size
+        if self.size > self.max_bytes:
+            self.evict()
+
+    def _entries(self):
+        """(mtime, size, path) of the cached entries"""
+        entries = []
+        for entry in os.scandir(self.dirpath):
+            if entry.name.endswith(SUFFIX):
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+        return entries
+
+    def evict(self):
+        """Remove least recently used entries until under `max_bytes`"""
+        entries = self._entries()
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+            self.stats['evictions'] += 1
+        self.size = total
+
+    def load(self, source, parse, version):
+        """
+        Return the parsed match for `source` (path or binary file-like),
+        calling `parse` on a miss and storing its output.
+        """
+        start = time.perf_counter()
+        data = _read_bytes(source)
+        key = self.key(data, version)
+        parsed = self.get(key)
+        if parsed is None:
+            parsed = parse(io.BytesIO(data))
+            self.put(key, parsed)
+            self.stats['misses'] += 1
+            self.stats['cold_time'] += time.perf_counter() - start
+        else:
+            self.stats['hits'] += 1
+            self.stats['warm_time'] += time.perf_counter() - start
+        return parsed
+
+    def report(self):
+        """Summary of hits, misses and mean cold and warm load times"""
+        hits, misses = self.stats['hits'], self.stats['misses']
+        cold = self.stats['cold_time'] / misses if misses else float('nan')
+        warm = self.stats['warm_time'] / hits if hits else float('nan')
+        return ('{:g} hits, {:g} misses, {:g} evictions; '
+                'cold load {:.2f}ms, warm load {:.2f}ms (x{:.1f})').format(
+                    hits, misses, self.stats['evictions'],
+                    cold * 1000, warm * 1000, cold / warm)
+
+
+def get_cache(dirpath):
+    """MatchCache of a directory, shared by all callers in the process"""
+    key = os.path.abspath(dirpath)
+    if key not in _CACHES:
+        _CACHES[key] = MatchCache(dirpath)
+    return _CACHES[key]
@@ -1,9 +1,11 @@
 
 from collections import defaultdict
 
+import numpy as np
 from bokeh.plotting import figure
-from bokeh.models import Arrow, NormalHead
 from bokeh.models import ColumnDataSource, LabelSet, HoverTool
+from bokeh.models import CDSView, BooleanFilter
+from bokeh.models import LinearColorMapper, ColorBar
 
 import utils
 
@@ -77,71 +79,118 @@ def plot_pitch(pw=12, ph=8, plot_height=800, plot_width=1200, title=''):
     return fig
 
 
-def _get_team_color(e, match):
-    if e.get('team_id', e.get('team')) == match.team_home['id']:
-        return BLACK
-    else:
-        return ORANGE
-
-
-def _add_forward(fig, ftype, e, match):
-    color = _get_team_color(e, match)
-    fig.diamond(x=[e['start']['x'] / 100],
-                y=[e['start']['y'] / 100],
-                size=10, color=color, line_width=2)
-    if ftype == 'goals_attempts':
-        line_dash = 'dashed'
-    else:
-        line_dash = 'solid'
-    arrow = Arrow(end=NormalHead(fill_color=color, line_color=color),
-                  line_color=color, line_width=2, line_dash=line_dash,
-                  x_start=e['start']['x'] / 100,
-                  y_start=e['start']['y'] / 100,
-                  x_end=e['end']['x'] / 100,
-                  y_end=e['end']['y'] / 100)
-    fig.add_layout(arrow)
-
-
-def _add_located(fig, ftype, e, match):
-    color = _get_team_color(e, match)
-    fig.diamond(x=[e['loc']['x'] / 100], y=[e['loc']['y'] / 100],
-                color=color, size=10, line_width=2)
-
-
-def _add_idxs(fig, attempt, match):
-    data = defaultdict(list)
-    for idx, (ftype, e) in enumerate(attempt):
-        data['x'].append(e.get('start', e.get('loc'))['x'] / 100)
-        data['y'].append(e.get('start', e.get('loc'))['y'] / 100)
-        data['idx'].append(idx)
-        data['mins'].append(e['mins'])
-        data['secs'].append(e['secs'])
-        data['ftype'].append(ftype)
-        data['atype'].append(e.get('action_type', ''))
-        data['type'].append(e.get('type', ''))
-        data['player'].append(match.get_player(e['player_id'])['name'])
-        data['team'].append(match.get_team(utils.get_team_id(e))['long_name'])
-    source = ColumnDataSource(data=data)
-    labels = LabelSet(
-        x='x', y='y', text='idx', level='glyph',
-        text_color='#d3d3d3', text_font_size='16px', text_font_style='bold',
-        x_offset=5, y_offset=-5, source=source, render_mode='css')
-    fig.add_layout(labels)
-    renderer = fig.circle(x='x', y='y', source=source, size=6)
-    hover = HoverTool(
-        renderers=[renderer], tooltips=[
+def _attempts_data(attempts, matches):
+    """
+    Columns with the events of many attempts, one dict of columns per
+    team side (home, away). Player and team names are resolved once per
+    distinct id and match.
+    """
+    data = {BLACK: defaultdict(list), ORANGE: defaultdict(list)}
+    names = {}
+    for attempt, match in zip(attempts, matches):
+        home_id = match.team_home['id']
+        for idx, (ftype, e) in enumerate(attempt):
+            team_id = utils.get_team_id(e)
+            key = id(match), e['player_id'], team_id
+            if key not in names:
+                names[key] = (match.get_player(e['player_id'])['name'],
+                              match.get_team(team_id)['long_name'])
+            player, team = names[key]
+            start, end = e.get('start', e.get('loc')), e.get('end')
+            cols = data[BLACK if team_id == home_id else ORANGE]
+            cols['x'].append(start['x'] / 100)
+            cols['y'].append(start['y'] / 100)
+            cols['end_x'].append(np.nan if end is None else end['x'] / 100)
+            cols['end_y'].append(np.nan if end is None else end['y'] / 100)
+            cols['idx'].append(idx)
+            cols['mins'].append(e['mins'])
+            cols['secs'].append(e['secs'])
+            cols['ftype'].append(ftype)
+            cols['atype'].append(e.get('action_type', ''))
+            cols['type'].append(e.get('type', ''))
+            cols['player'].append(player)
+            cols['team'].append(team)
+    return data
+
+
+def add_attempts(fig, attempts, match, labels=False):
+    """
+    Draw many attempts at once (e.g. a whole season) with one shared
+    ColumnDataSource and a fixed number of vectorized glyphs per team,
+    instead of a glyph and an annotation per event.
+
+    Parameters:
+    -----------
+    attempts: list of attempts (see SquawkaMatch.get_attempts)
+    match: SquawkaMatch of all attempts, or list with the match of each
+    labels: bool, whether to label events with their index in the attempt
+    """
+    attempts = list(attempts)
+    matches = match if isinstance(match, (list, tuple)) else \
+        [match] * len(attempts)
+    renderers = []
+    for color, cols in _attempts_data(attempts, matches).items():
+        if not cols:
+            continue
+        source = ColumnDataSource(data=cols)
+        end_x, end_y = np.array(cols['end_x']), np.array(cols['end_y'])
+        forward = ~np.isnan(end_x)
+        shot = np.array(cols['ftype']) == 'goals_attempts'
+        # arrow heads point along the segment in screen space
+        dx = (end_x - np.array(cols['x'])) * fig.plot_width
+        dy = (end_y - np.array(cols['y'])) * fig.plot_height
+        source.data['angle'] = np.where(
+            forward, np.arctan2(dy, dx) - np.pi / 2, 0)
+        for mask, line_dash in ((forward & ~shot, 'solid'),
+                                (forward & shot, 'dashed')):
+            if not mask.any():
+                continue
+            view = CDSView(source=source,
+                           filters=[BooleanFilter(mask.tolist())])
+            fig.segment(x0='x', y0='y', x1='end_x', y1='end_y',
+                        source=source, view=view, color=color,
+                        line_width=2, line_dash=line_dash)
+            fig.triangle(x='end_x', y='end_y', angle='angle',
+                         source=source, view=view, size=8, color=color)
+        renderers.append(fig.diamond(x='x', y='y', source=source, size=10,
+                                     color=color, line_width=2))
+        if labels:
+            fig.add_layout(LabelSet(
+                x='x', y='y', text='idx', level='glyph',
+                text_color='#d3d3d3', text_font_size='16px',
+                text_font_style='bold', x_offset=5, y_offset=-5,
+                source=source, render_mode='css'))
+    fig.add_tools(HoverTool(
+        renderers=renderers, tooltips=[
             ('index', '@idx'), ('(x,y)', '($x, $y)'),
             ('(mins,secs)', '(@mins, @secs)'), ('ftype', '@ftype'),
             ('atype', '@atype'), ('type', '@type'),
             ('player', '@player'), ('team', '@team')
-        ])
-    fig.add_tools(hover)
+        ]))
 
 
 def add_attempt(fig, attempt, match):
-    _add_idxs(fig, attempt, match)
-    for idx, (ftype, e) in enumerate(attempt):
-        if 'start' in e or 'end' in e:
-            _add_forward(fig, ftype, e, match)
-        elif 'loc' in e:
-            _add_located(fig, ftype, e, match)
+    add_attempts(fig, [attempt], match, labels=True)
+
+
+def add_density(fig, grid, palette='Inferno256', alpha=0.7, colorbar=True):
+    """
+    Draw a binned pitch grid (see density.bin_counts) as a single image
+    glyph over the pitch, so that the cost of rendering doesn't depend on
+    the number of events. Empty cells are transparent.
+
+    Parameters:
+    -----------
+    grid: float array (bins along pitch length, bins along pitch width)
+    palette: str or list of colors
+    """
+    grid = np.asarray(grid, dtype=float)
+    image = np.where(grid > 0, grid, np.nan).T  # image rows run along y
+    mapper = LinearColorMapper(
+        palette=palette, low=0, high=max(np.nanmax(grid), 1e-12),
+        nan_color=(0, 0, 0, 0))
+    renderer = fig.image(image=[image], x=0, y=0, dw=1, dh=1,
+                         color_mapper=mapper, global_alpha=alpha)
+    if colorbar:
+        fig.add_layout(ColorBar(color_mapper=mapper), 'right')
+    return renderer
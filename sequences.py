@@ -0,0 +1,230 @@
+import json
+import os
+import shutil
+
+import numpy as np
+
+from utils import TIME_SLICE_EVENTS
+
+PAD, UNK = 0, 1
+# token fields of every event, encoded with a vocabulary each
+TOKENS = ('ftype', 'type', 'action_type')
+# float channels of every event. Coordinates are scaled to [0, 1] and
+# missing end coordinates are 0 (see has_end). dt is the time (in minutes)
+# from the event to the attempt, attacking whether the event belongs to
+# the attempting team.
+CHANNELS = ('x', 'y', 'end_x', 'end_y', 'has_end', 'time', 'dt',
+            'attacking')
+# numeric attempt features (see SquawkaMatch.xGs), NaN if missing
+FEATURES = ('is_home', 'headed', 'is_goal', 'distance', 'possession',
+            'angle', 'x', 'y', 'mins', 'secs', 'has_assist', 'assist_x',
+            'assist_y', 'assist_angle', 'assist_dist', 'attack', 'defend')
+# attempt identifiers, stored as jsonl
+KEYS = ('competition', 'match', 'team_id', 'player_id', 'assist_id')
+ARRAYS = {'tokens': np.int32, 'channels': np.float32,
+          'lengths': np.int32, 'feats': np.float32}
+
+
+class Vocabulary(object):
+    """
+    Token ids per field (see TOKENS), with 0 for padding and 1 for unknown
+    tokens. Filter types are known in advance. Other fields grow with new
+    tokens unless the vocabulary is `frozen`, so that a saved vocabulary
+    gives the same ids for new corpora.
+    """
+    def __init__(self, tokens=None, frozen=False):
+        self.tokens = tokens or {field: [] for field in TOKENS}
+        self.frozen = frozen
+        if not self.tokens['ftype']:
+            self.tokens['ftype'] = list(TIME_SLICE_EVENTS)
+        self.ids = {field: {t: idx + 2 for idx, t in enumerate(tokens)}
+                    for field, tokens in self.tokens.items()}
+
+    def __len__(self):
+        return sum(len(tokens) for tokens in self.tokens.values())
+
+    def encode(self, field, token):
+        ids = self.ids[field]
+        if token not in ids:
+            if self.frozen:
+                return UNK
+            ids[token] = len(ids) + 2
+            self.tokens[field].append(token)
+        return ids[token]
+
+    def decode(self, field, idx):
+        if idx < 2:
+            return None
+        return self.tokens[field][idx - 2]
+
+    def save(self, path):
+        with open(path, 'w') as f:
+            json.dump(self.tokens, f, indent=1)
+
+    @classmethod
+    def load(cls, path, frozen=True):
+        with open(path) as f:
+            return cls(tokens=json.load(f), frozen=frozen)
+
+
+def _encode(seq, feats, vocab):
+    """Encode an attempt into (tokens, channels, features) arrays"""
+    tokens = np.empty((len(seq), len(TOKENS)), dtype=np.int32)
+    channels = np.zeros((len(seq), len(CHANNELS)), dtype=np.float32)
+    shot_time = feats['mins'] + feats['secs'] / 60
+    for i, e in enumerate(seq):
+        for j, field in enumerate(TOKENS):
+            tokens[i, j] = vocab.encode(field, e[field] or '')
+        has_end = e['end_x'] != ''
+        time = e['mins'] + e['secs'] / 60
+        channels[i] = (
+            e['x'] / 100, e['y'] / 100,
+            e['end_x'] / 100 if has_end else 0.,
+            e['end_y'] / 100 if has_end else 0.,
+            has_end, time / 90, shot_time - time,
+            e['team_id'] == feats['team_id'])
+    row = []
+    for name in FEATURES:
+        if name == 'has_assist':
+            value = feats['assist_id'] is not None
+        else:
+            value = feats[name]
+        row.append(np.nan if value is None else value)
+    return tokens, channels, np.array(row, dtype=np.float32)
+
+
+def _write_npy(raw_path, path, dtype, shape):
+    """Turn a file of raw (C-ordered) values into a .npy file"""
+    with open(path, 'wb') as out, open(raw_path, 'rb') as raw:
+        np.lib.format.write_array_header_1_0(out, {
+            'descr': np.lib.format.dtype_to_descr(np.dtype(dtype)),
+            'fortran_order': False, 'shape': shape})
+        shutil.copyfileobj(raw, out)
+    os.remove(raw_path)
+
+
+class SequenceWriter(object):
+    """
+    Write xG rows (see export.export_xGs) as sequence tensors for
+    sequence models. Attempt sequences are stored ragged: events of all
+    attempts are concatenated and `offsets` delimit each attempt. Arrays
+    are streamed to disk, so memory doesn't grow with the corpus.
+
+    Files in `output` (a directory):
+    --------------------------------
+    tokens.npy: int32 (n_events, len(TOKENS)), vocabulary ids
+    channels.npy: float32 (n_events, len(CHANNELS))
+    offsets.npy: int64 (n_attempts + 1), start of each attempt's events
+    lengths.npy: int32 (n_attempts), number of events of each attempt
+    feats.npy: float32 (n_attempts, len(FEATURES))
+    keys.jsonl: attempt identifiers (see KEYS)
+    vocab.json, meta.json: vocabulary and field names
+
+    Parameters:
+    -----------
+    output: str, output directory
+    vocab: Vocabulary or path to a saved one (a new one is built if None)
+    """
+    def __init__(self, output, vocab=None):
+        os.makedirs(output, exist_ok=True)
+        self.output = output
+        if isinstance(vocab, str):
+            vocab = Vocabulary.load(vocab)
+        self.vocab = vocab or Vocabulary()
+        self.n_attempts, self.n_events = 0, 0
+        self.files = {name: open(self._path(name, '.raw'), 'wb')
+                      for name in ARRAYS}
+        self.keys = open(self._path('keys', '.jsonl'), 'w')
+
+    def _path(self, name, suffix='.npy'):
+        return os.path.join(self.output, name + suffix)
+
+    def write(self, row):
+        tokens, channels, feats = _encode(row['seq'], row, self.vocab)
+        self.files['tokens'].write(tokens.tobytes())
+        self.files['channels'].write(channels.tobytes())
+        self.files['lengths'].write(
+            np.array([len(tokens)], dtype=np.int32).tobytes())
+        self.files['feats'].write(feats.tobytes())
+        self.keys.write(json.dumps({k: row.get(k) for k in KEYS}) + '\n')
+        self.n_attempts += 1
+        self.n_events += len(tokens)
+
+    def flush(self):
+        for f in self.files.values():
+            f.flush()
+        self.keys.flush()
+
+    def close(self):
+        for f in self.files.values():
+            f.close()
+        self.keys.close()
+        shapes = {'tokens': (self.n_events, len(TOKENS)),
+                  'channels': (self.n_events, len(CHANNELS)),
+                  'lengths': (self.n_attempts,),
+                  'feats': (self.n_attempts, len(FEATURES))}
+        for name, dtype in ARRAYS.items():
+            _write_npy(self._path(name, '.raw'), self._path(name),
+                       dtype, shapes[name])
+        lengths = np.load(self._path('lengths'))
+        np.save(self._path('offsets'),
+                np.concatenate([[0], np.cumsum(lengths, dtype=np.int64)]))
+        self.vocab.save(self._path('vocab', '.json'))
+        with open(self._path('meta', '.json'), 'w') as f:
+            json.dump({'tokens': TOKENS, 'channels': CHANNELS,
+                       'features': FEATURES, 'n_attempts': self.n_attempts,
+                       'n_events': self.n_events}, f, indent=1)
+
+
+def write_sequences(xGs, output, vocab=None):
+    """Write the output of SquawkaMatch.xGs (of one or many matches)"""
+    writer = SequenceWriter(output, vocab=vocab)
+    try:
+        for bg, seq, feats in xGs:
+            writer.write({'seq': seq, **bg, **feats})
+    finally:
+        writer.close()
+    return writer.n_attempts
+
+
+class SequenceCorpus(object):
+    """
+    Memory-mapped sequence tensors written by SequenceWriter. Nothing is
+    parsed or loaded upfront, and any batch of attempts can be read at
+    random as padded arrays.
+    """
+    def __init__(self, dirpath):
+        self.dirpath = dirpath
+        for name in ('tokens', 'channels', 'offsets', 'lengths', 'feats'):
+            setattr(self, name, np.load(
+                os.path.join(dirpath, name + '.npy'), mmap_mode='r'))
+        self.vocab = Vocabulary.load(os.path.join(dirpath, 'vocab.json'))
+
+    def __len__(self):
+        return len(self.lengths)
+
+    def keys(self):
+        with open(os.path.join(self.dirpath, 'keys.jsonl')) as f:
+            return [json.loads(line) for line in f]
+
+    def batch(self, idxs, max_len=None):
+        """
+        Padded batch of attempts. Sequences longer than `max_len` keep
+        their last (closest to the attempt) events.
+
+        Returns: (tokens, channels, lengths, feats), with tokens (B, L,
+            len(TOKENS)) padded with PAD and channels (B, L, len(CHANNELS))
+            padded with 0, where L is the longest (or max_len) sequence
+        """
+        idxs = np.asarray(idxs)
+        lengths = self.lengths[idxs]
+        if max_len is not None:
+            lengths = np.minimum(lengths, max_len)
+        width = int(lengths.max()) if len(idxs) else 0
+        tokens = np.full((len(idxs), width, len(TOKENS)), PAD, np.int32)
+        channels = np.zeros((len(idxs), width, len(CHANNELS)), np.float32)
+        ends = self.offsets[idxs + 1]
+        for b, (end, length) in enumerate(zip(ends, lengths)):
+            tokens[b, :length] = self.tokens[end - length:end]
+            channels[b, :length] = self.channels[end - length:end]
+        return tokens, channels, lengths, np.asarray(self.feats[idxs])
@@ -0,0 +1,156 @@
+import numpy as np
+
+from collection import _as_list
+from events import FTYPE_IDS
+from utils import transform_locs
+
+# coordinates that can be indexed. `origin` is start, falling back to loc
+# (see EventTable.origin)
+POINTS = ('origin', 'start', 'end', 'loc')
+
+# named zones (x0, y0, x1, y1) in squawka units, attacking left to right,
+# with pitch proportions as in utils.transform_loc (105m x 60m)
+ZONES = {
+    'penalty_box': (100 - 16.5 / 1.05, 50 - 20.16 / 0.6,
+                    100, 50 + 20.16 / 0.6),
+    'six_yard_box': (100 - 5.5 / 1.05, 50 - 9.16 / 0.6,
+                     100, 50 + 9.16 / 0.6),
+    'own_penalty_box': (0, 50 - 20.16 / 0.6, 16.5 / 1.05, 50 + 20.16 / 0.6),
+    # central zone right outside the box, in the 6 x 3 zone grid
+    'zone_14': (100 * 4 / 6, 100 / 3, 100 * 5 / 6, 100 * 2 / 3),
+    'defensive_third': (0, 0, 100 / 3, 100),
+    'middle_third': (100 / 3, 0, 100 * 2 / 3, 100),
+    'final_third': (100 * 2 / 3, 0, 100, 100)}
+
+
+def _to_squawka(x, y, units):
+    if units == 'meters':
+        return x / 1.05, y / 0.6
+    if units != 'squawka':
+        raise ValueError("Unknown units: {}".format(units))
+    return x, y
+
+
+class SpatialIndex(object):
+    """
+    Uniform grid index over the event coordinates of an EventTable (of a
+    SquawkaMatch or a MatchCollection) for pitch-region queries. For each
+    indexed point (see POINTS), rows are sorted by grid cell so that a
+    query only checks the events in the cells it overlaps. Grids are
+    built on first use.
+
+    Queries take coordinates in squawka units (0-100) or in meters (see
+    utils.transform_loc) and return sorted row indices of the table,
+    optionally filtered by time, team, player and filter type.
+
+    Parameters:
+    -----------
+    table: EventTable
+    cell: float, cell size in squawka units
+    """
+    def __init__(self, table, cell=5.):
+        self.table, self.cell = table, cell
+        self.n_cells = int(np.ceil(100 / cell))
+        self._grids = {}
+
+    def coordinates(self, point='origin'):
+        table = self.table
+        if point == 'origin':
+            return table.origin()
+        if point not in POINTS:
+            raise ValueError("Unknown point: {}".format(point))
+        return getattr(table, point + '_x'), getattr(table, point + '_y')
+
+    def _cells(self, v):
+        return np.clip((v // self.cell).astype(int), 0, self.n_cells - 1)
+
+    def _grid(self, point):
+        """(order, bounds): rows sorted by cell and cell boundaries"""
+        if point not in self._grids:
+            x, y = self.coordinates(point)
+            rows = np.flatnonzero(~np.isnan(x))
+            codes = self._cells(x[rows]) * self.n_cells + self._cells(y[rows])
+            order = np.argsort(codes, kind='stable')
+            counts = np.bincount(codes, minlength=self.n_cells ** 2)
+            bounds = np.concatenate([[0], np.cumsum(counts)])
+            self._grids[point] = rows[order], bounds
+        return self._grids[point]
+
+    def _candidates(self, x0, y0, x1, y1, point):
+        """Rows in the cells overlapping a rectangle (squawka units)"""
+        order, bounds = self._grid(point)
+        cx0, cx1 = self._cells(np.array([x0, x1]))
+        cy0, cy1 = self._cells(np.array([y0, y1]))
+        chunks = []
+        for cx in range(cx0, cx1 + 1):
+            # cells of a column are contiguous
+            start = bounds[cx * self.n_cells + cy0]
+            end = bounds[cx * self.n_cells + cy1 + 1]
+            chunks.append(order[start:end])
+        return np.concatenate(chunks) if chunks else order[:0]
+
+    def _filter(self, rows, mins=None, team=None, player=None, ftype=None,
+                idxs=None):
+        table = self.table
+        keep = np.ones(len(rows), dtype=bool)
+        if mins is not None:
+            lo, hi = mins
+            keep &= table.timed[rows]
+            if lo is not None:
+                keep &= table.mins[rows] >= lo
+            if hi is not None:
+                keep &= table.mins[rows] < hi
+        if team is not None:
+            keep &= np.isin(table.team[rows], _as_list(team))
+        if player is not None:
+            keep &= np.isin(table.player[rows], _as_list(player))
+        if ftype is not None:
+            keep &= np.isin(table.ftype[rows],
+                            [FTYPE_IDS[f] for f in _as_list(ftype)])
+        if idxs is not None:
+            keep &= np.isin(rows, idxs)
+        return np.sort(rows[keep])
+
+    def rect(self, x0, y0, x1, y1, point='origin', units='squawka',
+             **filters):
+        """
+        Rows with `point` inside a rectangle (bounds included).
+
+        Parameters:
+        -----------
+        point: str, one of POINTS
+        units: str, 'squawka' or 'meters'
+        filters: mins (tuple (from, to) in minutes, `to` exclusive, either
+            can be None), team, player and ftype (a value or a list of
+            values) and idxs (restrict to these rows, e.g. from
+            MatchCollection.query)
+        """
+        x0, y0 = _to_squawka(x0, y0, units)
+        x1, y1 = _to_squawka(x1, y1, units)
+        rows = self._candidates(x0, y0, x1, y1, point)
+        x, y = self.coordinates(point)
+        x, y = x[rows], y[rows]
+        rows = rows[(x >= x0) & (x <= x1) & (y >= y0) & (y <= y1)]
+        return self._filter(rows, **filters)
+
+    def radius(self, x, y, r, point='origin', units='squawka', **filters):
+        """
+        Rows with `point` within distance `r` of (x, y). In meters the
+        distance is euclidean after utils.transform_locs, so the region is
+        a circle on the pitch (and an ellipse in squawka units).
+        """
+        cx, cy = _to_squawka(x, y, units)
+        rx, ry = _to_squawka(r, r, units)
+        rows = self._candidates(cx - rx, cy - ry, cx + rx, cy + ry, point)
+        px, py = self.coordinates(point)
+        px, py = px[rows], py[rows]
+        if units == 'meters':
+            (px, py), (cx, cy) = transform_locs(px, py), (x, y)
+        rows = rows[(px - cx) ** 2 + (py - cy) ** 2 <= r ** 2]
+        return self._filter(rows, **filters)
+
+    def zone(self, name, point='origin', **filters):
+        """Rows with `point` inside one of the named ZONES"""
+        if name not in ZONES:
+            raise ValueError("Unknown zone: {}".format(name))
+        return self.rect(*ZONES[name], point=point, **filters)
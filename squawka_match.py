@@ -1,18 +1,37 @@
 
+import bisect
+import functools
+import io
 import os
 import re
 from datetime import datetime
 from collections import defaultdict
 
 from lxml import etree
+import numpy as np
 
 from utils import TIME_SLICE_EVENTS
+from events import Event, EventTable, FTYPE_IDS
+from match_cache import MatchCache, get_cache
+from stats import NULL_STATS
 import utils
 
+# bump when the parsed representation of a match changes (see MatchCache)
+PARSER_VERSION = 4
+
 # regexes
 TS = '(\d+)[^\d]+(\d+)'
 LOC = '([\d\.]+)[^\d]+([\d+\.]+)'
 COMP_ID = '(.*)_(\d+).xml'
+TS_RE = re.compile(TS)
+LOC_RE = re.compile(LOC)
+COMP_ID_RE = re.compile(COMP_ID)
+
+# possession slices (5 minutes) ending the first and second half
+HALF_SLICE, LAST_SLICE = 8, 17
+
+# date formats
+KICKOFF = '%a, %d %b %Y %H:%M:%S %z'
 
 # attr types
 COORS = ('loc', 'start', 'middle', 'end')
@@ -22,17 +41,11 @@ INTS = ('mins', 'minsec', 'secs', 'weight', 'height', 'shirt_num', 'age')
 DATES = ('dob',)
 
 # xpaths
-EVENTS = '/squawka/data_panel/filters/{}/time_slice/event'
-TEAM = '/squawka/data_panel/game/team[@id="{}"]'
-PLAYER = '/squawka/data_panel/players/player[@id="{}"]'
-HOME = '/squawka/data_panel/game/team[state = "home"]'
-AWAY = '/squawka/data_panel/game/team[state = "away"]'
-GOAL = '/squawka/data_panel/filters/goals_attempts' + \
-       '/time_slice/event[@type="goal" and @team_id="{}"]'
-POSSESION = '/squawka/data_panel/possession/period/' + \
-            'time_slice[@name="{}"]/team_possession[@team_id="{}"]/text()'
-POSSESION_IJP = '/squawka/data_panel/possession/period/' + \
-                'time_slice[@name="{}"]/team_possession[@team_id="{}"]/text()'
+GAME = etree.XPath('/squawka/data_panel/game')
+PLAYERS = etree.XPath('/squawka/data_panel/players/player')
+POSSESION = etree.XPath(
+    '/squawka/data_panel/possession/period/time_slice/team_possession')
+FILTERS = etree.XPath('/squawka/data_panel/filters')
 GA_RESULT = '/squawka/data_panel/filters/goals_attempts/' + \
             'time_slice[@name="{}"]/ga_result'
 
@@ -43,49 +56,307 @@ ID_TEAM = ('tackles', 'crosses', 'corners', 'keepersweeper',
            'setpieces', 'offside')
 
 
+def _parse_loc(attr_val):
+    x, y = LOC_RE.match(attr_val).groups()
+    return {'x': float(x), 'y': float(y)}
+
+
+def _parse_bool(attr_val):
+    if attr_val == 'true' or attr_val == 'yes':
+        return True
+    else:
+        assert attr_val == 'false'
+        return False
+
+
+@functools.lru_cache(maxsize=4096)
+def _parse_date(attr_val):
+    return datetime.strptime(attr_val, '%d/%m/%Y')
+
+
+# attr key -> converter
+CONVERTERS = {
+    **{k: _parse_loc for k in COORS},
+    **{k: _parse_bool for k in BOOLS},
+    **{k: float for k in FLOATS},
+    **{k: int for k in INTS},
+    **{k: _parse_date for k in DATES}}
+
+
 def _parse_node(node, **kwargs):
+    get = CONVERTERS.get
     # attributes
-    attrs = {k: _parse_attr(k, v) for k, v in node.attrib.items()}
+    parsed = {}
+    for k, v in node.attrib.items():
+        converter = get(k)
+        parsed[k] = v if converter is None else converter(v)
     # children
-    children = {}
-    for c in node.getchildren():
-        for k, v in [(c.tag, c.text)] + list(c.attrib.items()):
-            c_key = c.tag + '_' + k if k in c.attrib else k
-            children[c_key] = _parse_attr(k, v)
-    return {**attrs, **children, **kwargs}
+    for c in node:
+        tag, c_attrib = c.tag, c.attrib
+        converter = get(tag)
+        c_key = tag + '_' + tag if tag in c_attrib else tag
+        parsed[c_key] = c.text if converter is None else converter(c.text)
+        for k, v in c_attrib.items():
+            converter = get(k)
+            parsed[tag + '_' + k] = v if converter is None else converter(v)
+    parsed.update(kwargs)
+    return parsed
 
 
 def _parse_attr(attr_key, attr_val, verbose=False):
-    if attr_key in COORS:
-        x, y = re.match(LOC, attr_val).groups()
-        return {'x': float(x), 'y': float(y)}
-    elif attr_key in BOOLS:
-        if attr_val == 'true' or attr_val == 'yes':
-            return True
-        else:
-            assert attr_val == 'false'
-            return False
-    elif attr_key in FLOATS:
-        return float(attr_val)
-    elif attr_key in INTS:
-        return int(attr_val)
-    elif attr_key in DATES:
-        return datetime.strptime(attr_val, '%d/%m/%Y')
-    else:
+    converter = CONVERTERS.get(attr_key)
+    if converter is None:
         if verbose:
             print("Not parsing ", attr_key, attr_val)
         return attr_val
+    return converter(attr_val)
+
+
+def _filter_type(ts_node):
+    """Return the filter type of a time slice under `filters` (or None)"""
+    filter_node = ts_node.getparent()
+    if filter_node is None or filter_node.getparent() is None or \
+       filter_node.getparent().tag != 'filters':
+        return None
+    return filter_node.tag
+
+
+def _iterparse(source):
+    """
+    Stream a squawka xml, parsing filter events as they are read and
+    clearing them from the tree afterwards. Only the (small) game, players
+    and possession sections are kept in the returned root.
+
+    Returns: (root, ftypes, events)
+    """
+    ftypes, events, slices = [], [], {}
+    context = etree.iterparse(
+        source, events=('end',), tag=('event', 'time_slice'))
+    for _, node in context:
+        ftype = _filter_type(node.getparent() if node.tag == 'event' else node)
+        if ftype is None or ftype not in TIME_SLICE_EVENTS:
+            continue
+        if node.tag == 'event':
+            name = node.getparent().attrib['name']
+            if name not in slices:  # (from, to), shared by its events
+                ts0, ts1 = TS_RE.match(name).groups()
+                slices[name] = int(ts0), int(ts1)
+            ftypes.append(ftype)
+            events.append(Event.from_dict(
+                _parse_node(node), ftype=ftype, ts=slices[name]))
+        else:                   # drop processed time slice with its events
+            node.clear()
+            node.getparent().remove(node)
+    return context.root, ftypes, events
+
+
+def _parse_game(game):
+    """Parse the game section into a dict with match metadata and teams"""
+    teams, states = {}, {}
+    for node in game.iter('team'):
+        team = _parse_node(node)
+        teams[team['id']] = team
+        states[team.get('state')] = team['id']
+    return {'name': game.findtext('name'),
+            'kickoff': datetime.strptime(game.findtext('kickoff'), KICKOFF),
+            'venue': game.findtext('venue'),
+            'teams': teams,
+            'home': states['home'],
+            'away': states['away']}
+
+
+def _xpath(xpath, root, stats=NULL_STATS):
+    """Evaluate a compiled xpath, counting the evaluation in `stats`"""
+    stats.incr('xpath_calls')
+    return xpath(root)
+
+
+def _parse_possession(root, teams, stats=NULL_STATS):
+    """
+    Parse the possession section into a table with a row per team (in
+    the order of `teams`, extended with any other team found) and a column
+    per 5-minute slice, including injury time slices. Missing values are
+    NaN. If a slice appears more than once the first one is kept.
+
+    Returns: dict with keys `teams` (list of team ids) and `table`
+    """
+    teams, values = list(teams), {}
+    for node in _xpath(POSSESION, root, stats):
+        ts0, _ = TS_RE.match(node.getparent().attrib['name']).groups()
+        team_id = node.attrib['team_id']
+        if team_id not in teams:
+            teams.append(team_id)
+        key = teams.index(team_id), int(ts0) // 5
+        values.setdefault(key, int(node.text))
+    n_slices = max([ts for _, ts in values] + [LAST_SLICE]) + 1
+    table = np.full((len(teams), n_slices), np.nan)
+    for (row, ts), value in values.items():
+        table[row, ts] = value
+    return {'teams': teams, 'table': table}
+
+
+def _parse(source, stats=NULL_STATS):
+    """
+    Parse a squawka xml into a dict holding all match contents: game
+    metadata, teams, players, possession table (see _parse_possession),
+    filter names and the EventTable. The dict is plain python (and numpy)
+    data, so that it can be stored by MatchCache.
+    """
+    with stats.timer('parse'):
+        root, ftypes, events = _iterparse(source)
+    stats.incr('events_parsed', len(events))
+    with stats.timer('xpath_extract'):
+        parsed = _parse_game(_xpath(GAME, root, stats)[0])
+        parsed['players'] = {}
+        for node in _xpath(PLAYERS, root, stats):
+            player = _parse_node(node)
+            parsed['players'][player['id']] = player
+        parsed['possession'] = _parse_possession(
+            root, [parsed['home'], parsed['away']], stats=stats)
+        parsed['filters'] = [c.tag for c in _xpath(FILTERS, root, stats)[0]]
+    with stats.timer('event_table'):
+        parsed['event_table'] = EventTable(ftypes, events)
+    return parsed
+
+
+def read_header(source):
+    """
+    Read match metadata (game section and final score) from a squawka xml
+    without parsing any of the filter events.
+
+    Returns: dict with keys name, kickoff, venue, team_home, team_away,
+        goals_home, goals_away. Teams are parsed team nodes.
+    """
+    game, goals = None, defaultdict(int)
+    context = etree.iterparse(
+        source, events=('end',), tag=('game', 'event'))
+    for _, node in context:
+        if node.tag == 'game':
+            game = node
+            continue
+        if _filter_type(node.getparent()) == 'goals_attempts' and \
+           node.attrib.get('type') == 'goal':
+            goals[node.attrib.get('team_id')] += 1
+        node.clear()
+    if game is None:
+        raise ValueError("Couldn't find game section")
+    header = _parse_game(game)
+    home, away = header['home'], header['away']
+    return {'name': header['name'],
+            'kickoff': header['kickoff'],
+            'venue': header['venue'],
+            'team_home': header['teams'][home],
+            'team_away': header['teams'][away],
+            'goals_home': goals[home],
+            'goals_away': goals[away]}
+
+
+def _take(table, rows, cols):
+    """Index a 2D table by arrays of rows and cols, NaN if out of bounds"""
+    valid = (rows >= 0) & (rows < table.shape[0]) & \
+        (cols >= 0) & (cols < table.shape[1])
+    out = np.full(rows.shape, np.nan)
+    out[valid] = table[rows[valid], cols[valid]]
+    return out
+
+
+def interpolate_possession(table, rows, mins, secs, injurytime=None):
+    """
+    Vectorized possession for the previous 5 minutes to given times, as a
+    weighted mean of the possession in the current and previous timeslice
+    (see SquawkaMatch.possession).
+
+    Parameters:
+    -----------
+    table: float array (n_rows, n_slices), possession per 5-minute slice,
+        e.g. as parsed by _parse_possession or stacked over matches
+    rows: int array, row in `table` for each query (e.g. team)
+    mins, secs: int arrays, query times
+    injurytime: bool array, whether each query is in injury time. Injury
+        time takes the possession of the last slice of the half.
+    """
+    rows, mins = np.asarray(rows, dtype=int), np.asarray(mins, dtype=int)
+    secs = np.asarray(secs, dtype=float)
+    if injurytime is None:
+        injurytime = np.zeros(mins.shape, dtype=bool)
+    injurytime = np.asarray(injurytime, dtype=bool)
+    ts, rest = np.divmod(mins, 5)
+    # no injury time after 90 mins, take last timeslice
+    ts1 = np.where(
+        injurytime, np.where(mins >= 90, LAST_SLICE, HALF_SLICE),
+        np.minimum(ts, LAST_SLICE))
+    poss1, poss0 = _take(table, rows, ts1), _take(table, rows, ts1 - 1)
+    weight1 = (rest / 5) + (secs / 60)
+    weight0 = ((5 - rest) / 5) + ((60 - secs) / 60)
+    weighted = (weight0 * poss0 + weight1 * poss1) / 2
+    return np.where(_single_slice(mins, injurytime), poss1, weighted)
+
+
+def _single_slice(mins, injurytime):
+    """Whether the possession at each time is the value of a single slice
+    (first slice, injury time or after 90 mins) instead of interpolated"""
+    mins = np.asarray(mins, dtype=int)
+    return np.asarray(injurytime, dtype=bool) | (mins >= 90) | (mins < 5)
+
+
+def _possession_values(possession, mins, injurytime):
+    """
+    Possessions as python values: single slice values are ints, as in the
+    xml, interpolated ones floats (and missing ones NaN).
+    """
+    single = _single_slice(mins, injurytime).tolist()
+    return [int(p) if exact and p == p else p
+            for p, exact in zip(np.asarray(possession).tolist(), single)]
+
+
+def _team_possessions(possession, mins, secs, team_ids, injurytime=None):
+    """
+    Possession of each team at each time, given a parsed possession (see
+    _parse_possession). Unknown teams or missing slices result in NaN.
+    """
+    rows = [possession['teams'].index(t) if t in possession['teams']
+            else -1 for t in team_ids]
+    return interpolate_possession(
+        possession['table'], rows, mins, secs, injurytime=injurytime)
+
+
+def _score_at(timeline, mins, secs):
+    """
+    Score right before each time, given a score timeline (see
+    SquawkaMatch.score_timeline).
+
+    Returns: (home, away), int arrays
+    """
+    times, home = timeline
+    query = np.asarray(mins) * 60 + np.asarray(secs)
+    goals = np.searchsorted(times, query, side='left')
+    return home[goals], goals - home[goals]
+
+
+def _background_info(competition, match_id, kickoff, home_id, away_id,
+                     score):
+    """Match info shared by all rows of a match (xGs, events)"""
+    goals_home, goals_away = score
+    return {'competition': competition,
+            'match': match_id,
+            'kickoff': kickoff,
+            'team_home': home_id,
+            'team_away': away_id,
+            'goals_home': goals_home,
+            'goals_away': goals_away,
+            'year': kickoff.year}
 
 
 def _flip_loc(e):
-    if 'start' in e or 'end' in e:
-        e['start']['x'] = 100 - e['start']['x']
-        e['start']['y'] = 100 - e['start']['y']
-        e['end']['x'] = 100 - e['end']['x']
-        e['end']['y'] = 100 - e['end']['y']
-    if 'loc' in e:
-        e['loc']['x'] = 100 - e['loc']['x']
-        e['loc']['y'] = 100 - e['loc']['y']
+    """Return a copy of the event with flipped coordinates. Events are
+    shared across calls (see SquawkaMatch.event_table) and must not be
+    modified in place."""
+    if isinstance(e, Event):
+        return e.flipped()
+    e = dict(e)
+    for key in ('start', 'end', 'loc'):
+        if key in e:
+            e[key] = {'x': 100 - e[key]['x'], 'y': 100 - e[key]['y']}
     return e
 
 
@@ -118,41 +389,211 @@ def _maybe_flip(ftype, e, team_id):
     return e
 
 
-def _get_assist(pass_e):
-    angle = 0.
-    from_x, from_y = pass_e['start']['x'], pass_e['start']['y']
-    to_x, to_y = pass_e['end']['x'], pass_e['end']['y']
-    dist = utils.euclidean(from_x, from_y, to_x, to_y)
-    if dist > 0:
-        angle = utils.angle((from_x, from_y), (to_x, to_y))
-    return from_x, from_y, dist, angle
+def _get_assist(attempt):
+    """Return the assisting pass of an attempt (or None)"""
+    if len(attempt) > 1:
+        last_type, last_e = attempt[-2]
+        if last_type == 'all_passes' and last_e['type'] == 'completed':
+            return last_e
+
+
+def _open_source(path_or_string, path=None):
+    """
+    Normalize the input of SquawkaMatch (path, str, bytes or binary
+    file-like) into something lxml can parse and the match path.
+
+    Returns: (source, path)
+    """
+    source = path_or_string
+    if isinstance(source, str) and os.path.isfile(source):
+        return source, source
+    if path is None:            # file-like objects may know their path
+        path = getattr(source, 'name', None)
+    if path is None:
+        raise ValueError("String input needs optional path")
+    if isinstance(source, str):
+        source = source.encode('utf')
+    if isinstance(source, bytes):
+        source = io.BytesIO(source)
+    return source, path
+
+
+def _path_ids(path):
+    """
+    Competition and match id of a match given its path, either a
+    <competition>_<match_id>.xml file or a squawka url.
+
+    Returns: (competition, match_id)
+    """
+    match = COMP_ID_RE.match(os.path.basename(path))
+    if match is not None:
+        return match.groups()
+    # assume url was given as path
+    return (re.findall("s3-irl-(.*)\.squawka\.com", path)[0],
+            re.findall("ingame/(.*)", path)[0])
+
+
+def _xG_rows(attempts, bg, home_id, results, possessions, stats=NULL_STATS):
+    """
+    Compute xG feature rows for a batch of attempts (see
+    SquawkaMatch.get_attempts), vectorizing geometry, score and
+    possession lookups over the whole batch.
+
+    Parameters:
+    -----------
+    attempts: list of attempts, lists of (ftype, event) ending in the shot
+    bg: dict, background match info shared by all rows
+    home_id: str, id of the home team
+    results: function (mins, secs) -> (home, away) score arrays
+    possessions: function (mins, secs, team_ids, injurytime) -> array
+
+    Returns: generator of (bg, seq, feats) (see SquawkaMatch.xGs)
+    """
+    # shot and assist geometry for all attempts at once
+    shots = [attempt[-1][1] for attempt in attempts]
+    with stats.timer('geometry'):
+        distances, angles = utils.shot_features(
+            [ga['end']['x'] for ga in shots],
+            [ga['end']['y'] for ga in shots])
+        passes = [_get_assist(attempt) for attempt in attempts]
+        coors = np.array(
+            [[p['start']['x'], p['start']['y'],
+              p['end']['x'], p['end']['y']]
+             if p else [0., 0., 0., 0.] for p in passes]).reshape(-1, 4)
+        a_dists, a_angles = utils.assist_features(*coors.T)
+        distances, angles = distances.tolist(), angles.tolist()
+        a_dists, a_angles = a_dists.tolist(), a_angles.tolist()
+    # current score at every attempt
+    with stats.timer('score'):
+        homes, aways = results(
+            [ga['mins'] for ga in shots], [ga['secs'] for ga in shots])
+        homes, aways = homes.tolist(), aways.tolist()
+    # possession at every attempt
+    with stats.timer('possession'):
+        mins = [ga['mins'] for ga in shots]
+        injurytime = [ga.get('injurytime_play') is not None for ga in shots]
+        possession = _possession_values(possessions(
+            mins, [ga['secs'] for ga in shots],
+            [utils.get_team_id(ga) for ga in shots], injurytime),
+            mins, injurytime)
+    for idx, attempt in enumerate(attempts):
+        (*attempt, (_, ga)), seq = list(attempt), []
+        # find if assist, by whom, from where, length, angle, etc.
+        a_id, a_x, a_y, a_dist, a_angle = None, 0., 0., 0., 0.
+        if passes[idx] is not None:
+            a_id = passes[idx]['player_id']
+            a_x, a_y = passes[idx]['start']['x'], passes[idx]['start']['y']
+            a_dist, a_angle = a_dists[idx], a_angles[idx]
+        # add current score
+        home, away = homes[idx], aways[idx]
+        if ga['team_id'] == home_id:
+            attack, defend = home, away
+        else:
+            attack, defend = away, home
+        # feats
+        feats = {'team_id': ga['team_id'],
+                 'player_id': ga['player_id'],
+                 'is_home': ga['team_id'] == home_id,
+                 'headed': ga.get('headed', False),
+                 'is_goal': ga['type'] == 'goal',
+                 'distance': distances[idx],
+                 'possession': possession[idx],
+                 'angle': angles[idx],
+                 'x': ga['end']['x'], 'y': ga['end']['y'],
+                 'mins': ga['mins'], 'secs': ga['secs'],
+                 'assist_x': a_x, 'assist_y': a_y, 'assist_id': a_id,
+                 'assist_angle': a_angle, 'assist_dist': a_dist,
+                 'attack': attack, 'defend': defend}
+        # sequential data
+        for ftype, e in attempt:
+            if not utils.is_loc(e):  # skip unlocated events
+                continue
+            seq.append({
+                'x': e.get('start', e.get('loc'))['x'],
+                'y': e.get('start', e.get('loc'))['y'],
+                'end_x': e.get('end', {'x': ''})['x'],
+                'end_y': e.get('end', {'y': ''})['y'],
+                'mins': e['mins'], 'secs': e['secs'],
+                'ftype': ftype, 'type': e.get('type', ''),
+                'action_type': e.get('action_type', ''),
+                'player_id': e['player_id'],
+                'team_id': utils.get_team_id(e)})
+        yield bg, seq, feats
+
+
+def event_batches(matches, batch_size=10000):
+    """
+    Event-level columns (see SquawkaMatch.event_columns) of an iterable of
+    matches in fixed-size chunks, which may span several matches. Only the
+    current match and one chunk are held in memory.
+
+    Returns: generator of dicts column -> list of `batch_size` values (the
+        last chunk may be shorter)
+    """
+    batch, size = None, 0
+    for match in matches:
+        columns = match.event_columns()
+        n, start = len(columns['x']), 0
+        while start < n:
+            take = min(batch_size - size, n - start)
+            if batch is None:
+                batch = {key: [] for key in columns}
+            for key, col in columns.items():
+                batch[key].extend(col[start:start + take])
+            size, start = size + take, start + take
+            if size == batch_size:
+                yield batch
+                batch, size = None, 0
+    if batch is not None:
+        yield batch
 
 
 class SquawkaMatch(object):
     """
     Class wrapping a squawka xml for easy access.
+
+    Parameters:
+    -----------
+    path_or_string: str, bytes or binary file-like object with the xml,
+        or path to the xml file
+    path: str, path or url of the match (needed for non-path input)
+    cache: MatchCache or str, optional cache (directory) of parsed matches.
+        Directories are opened with match_cache.get_cache, so matches
+        loaded from the same directory share their cache and its stats.
     """
-    def __init__(self, path_or_string, path=None):
-        self._cache = defaultdict(lambda: defaultdict(dict))
-        if os.path.isfile(path_or_string):
-            self.path = path_or_string
-            with open(path_or_string, 'r') as f:
-                self.xml = etree.fromstring(bytes(f.read(), 'utf'))
-        else:
-            if path is None:
-                raise ValueError("String input needs optional path")
-            self.path = path
-            self.xml = etree.fromstring(bytes(path_or_string, 'utf'))
+    def __init__(self, path_or_string, path=None, cache=None, stats=None):
+        self._cache = {}
+        self.stats = stats or NULL_STATS
+        source, self.path = _open_source(path_or_string, path=path)
+        parse = functools.partial(_parse, stats=self.stats)
+        with self.stats.timer('load'):
+            if cache is None:
+                self._parsed = parse(source)
+            else:
+                if not isinstance(cache, MatchCache):
+                    cache = get_cache(cache)
+                self._parsed = cache.load(source, parse, PARSER_VERSION)
+        self.event_table = self._parsed['event_table']
 
     @classmethod
     def search(cls, dirpath, team1, team2, competition,
-               team_prop='short_name'):
-        for f in os.listdir(dirpath):
-            if f.startswith(competition):
-                m = cls(os.path.join(dirpath, f))
-                h, a = m.team_home[team_prop], m.team_away[team_prop]
-                if (h == team1 and a == team2) or (a == team1 and h == team2):
-                    yield m
+               team_prop='short_name', index_path=None, **kwargs):
+        """
+        Find matches between two teams in a directory. Candidates are
+        looked up in the directory's MatchCatalog (at `index_path`, by
+        default inside `dirpath`), which is refreshed before searching,
+        so only the matching files are parsed. If the index can't be
+        written, the directory headers are scanned instead (see
+        catalog.open_catalog). Extra kwargs are passed on to
+        MatchCatalog.find (e.g. season).
+        """
+        from catalog import open_catalog
+        with open_catalog(dirpath, index_path=index_path) as catalog:
+            rows = list(catalog.find(
+                team1=team1, team2=team2, competition=competition,
+                team_prop=team_prop, **kwargs))
+        for row in rows:
+            yield cls(row['path'])
 
     def __getattr__(self, name):
         if name in TIME_SLICE_EVENTS:
@@ -168,24 +609,15 @@ class SquawkaMatch(object):
             self.name, home, away, self.competition, date)
 
     def _get_filter_events(self, filter_type):
-        events, elements = [], self.xml.xpath(EVENTS.format(filter_type))
-        if elements is not None:
-            for e in elements:
-                # parent (timeslice)
-                ts0, ts1 = re.match(TS, e.getparent().attrib['name']).groups()
-                ts = {'timeslice': {'from': int(ts0), 'to': int(ts1)}}
-                events.append(_parse_node(e, ts=ts))
-        return events
+        table = self.event_table
+        with self.stats.timer('filter_events'):
+            return [table.records[i] for i in table.filter_idxs(filter_type)]
 
     def get_timed_events(self):
         """Return events with time information"""
-        for f in self.filters:
-            try:
-                for event in getattr(self, f):
-                    if 'mins' in event and 'secs' in event:
-                        yield f, event
-            except AttributeError:
-                continue
+        table = self.event_table
+        for idx in table.timed_idxs():
+            yield table.ftype_name(idx), table.records[idx]
 
     def get_attempts(self, filter_goals=False, breaks=1):
         """
@@ -197,68 +629,64 @@ class SquawkaMatch(object):
         filter_goals: bool, whether to filter for goal events
         breaks: int (default = 1), maximum number ball possession
             changes to include in the returned event.
+
+        Attempts are slices of the possession chains computed once per
+        match by EventTable.chains; shared events are never modified.
         """
-        events = list(self.get_timed_events())
-        events = sorted(events, key=lambda e: (e[1]['mins'], e[1]['secs']))
-        for idx, (ftype, e) in enumerate(events):
-            if ftype == 'goals_attempts':
-                # filter goals if argument passed
-                if filter_goals and e['type'] != 'goal':
-                    continue
-                team_id = utils.get_team_id(e)
-                attempt, ctx_idx, ctx_breaks = [], idx - 1, 0
-                while ctx_idx > 0:
-                    ctx_ftype, ctx_e = events[ctx_idx]
-                    ctx_breaks += utils.get_team_id(ctx_e) != team_id
-                    # break on overlapping attempts or possesion change
-                    if ctx_ftype == 'goals_attempts' or ctx_breaks > breaks:
-                        break
-                    # skip extra heat maps
-                    elif ctx_ftype == 'extra_heat_maps':
-                        ctx_idx -= 1
-                        continue
-                    # skip unlocated or irrelevant events
-                    elif not utils.is_loc(ctx_e):
-                        ctx_idx -= 1
-                        continue
-                    # record the event
-                    else:
-                        # flip if event belongs to other team
-                        ctx_e = _maybe_flip(ctx_ftype, ctx_e, team_id)
-                        attempt.append((ctx_ftype, ctx_e))
-                        ctx_ftype, ctx_e = events[ctx_idx]
-                        ctx_idx -= 1
-                yield attempt[::-1] + [(ftype, e)]
+        table = self.event_table
+        with self.stats.timer('segmentation'):
+            idxs, chain, ctx_breaks, ends = table.chains()
+        ftypes = table.ftype[idxs]
+        # skip extra heat maps, unlocated or irrelevant events, and
+        # events beyond the maximum number of possession changes
+        keep = (ftypes != FTYPE_IDS['extra_heat_maps']) & \
+            table.located[idxs] & (ctx_breaks >= 0) & (ctx_breaks <= breaks)
+        for c, end in enumerate(ends):
+            ftype, e = 'goals_attempts', table.records[idxs[end]]
+            # filter goals if argument passed
+            if filter_goals and e['type'] != 'goal':
+                continue
+            team_id, attempt = utils.get_team_id(e), []
+            start = 0 if c == 0 else ends[c - 1] + 1
+            for pos in start + np.flatnonzero(keep[start:end]):
+                ctx_ftype = TIME_SLICE_EVENTS[ftypes[pos]]
+                ctx_e = table.records[idxs[pos]]
+                # flip (a copy) if event belongs to other team
+                ctx_e = _maybe_flip(ctx_ftype, ctx_e, team_id)
+                attempt.append((ctx_ftype, ctx_e))
+            self.stats.incr('attempts')
+            yield attempt + [(ftype, e)]
 
     def _background_info(self):
-        goals_home, goals_away = self.score
-        return {'competition': self.competition,
-                'match': self.match_id,
-                'kickoff': self.kickoff,
-                'team_home': self.team_home['id'],
-                'team_away': self.team_away['id'],
-                'goals_home': goals_home,
-                'goals_away': goals_away,
-                'year': self.kickoff.year}
+        return _background_info(
+            self.competition, self.match_id, self.kickoff,
+            self.team_home['id'], self.team_away['id'], self.score)
+
+    def event_columns(self):
+        """
+        Match info at the event-level as columns (lists), with the
+        background info broadcast to every timed and located event.
+        """
+        bg, table = self._background_info(), self.event_table
+        idxs = table.timed_idxs()
+        idxs = idxs[table.located[idxs]]  # skip unlocated events
+        columns = {key: [value] * len(idxs) for key, value in bg.items()}
+        columns.update(table.row_columns(idxs))
+        return columns
+
+    def event_batches(self, batch_size=10000):
+        """Event-level columns in chunks (see event_batches)"""
+        return event_batches([self], batch_size=batch_size)
 
     def event_rows(self):
         """
-        Get match info at the event-level for csv exporting.
+        Get match info at the event-level for csv exporting, as a new
+        dict per event. Use event_batches to avoid per-row dicts.
         """
-        bg = self._background_info()
-        for ftype, e in self.get_timed_events():
-            if not utils.is_loc(e):  # skip unlocated events
-                continue
-            bg['x'] = e.get('start', e.get('loc'))['x']
-            bg['y'] = e.get('start', e.get('loc'))['y']
-            bg['end_x'] = e.get('end', {'x': ''})['x']
-            bg['end_y'] = e.get('end', {'y': ''})['y']
-            bg['mins'], bg['secs'] = e['mins'], e['secs']
-            bg['ftype'], bg['type'] = ftype, e.get('type', '')
-            bg['action_type'] = e.get('action_type', '')
-            bg['player_id'] = e['player_id']
-            bg['team_id'] = utils.get_team_id(e)
-            yield bg
+        for batch in self.event_batches():
+            keys = list(batch)
+            for values in zip(*batch.values()):
+                yield dict(zip(keys, values))
 
     def xGs(self, **kwargs):
         """
@@ -270,153 +698,117 @@ class SquawkaMatch(object):
         seq: list, sequence of timed and located events leading to the attempt
         feats: dict, extracted features from the attempt
         """
-        bg = self._background_info()
-        for attempt in self.get_attempts(**kwargs):
-            (*attempt, (_, ga)), seq = list(attempt), []
-            mins, secs, team_id = ga['mins'], ga['secs'], utils.get_team_id(ga)
-            injurytime = ga.get("injurytime_play", None)
-            # find if assist, by whom, from where, length, angle, etc.
-            a_id, a_x, a_y, a_dist, a_angle = None, 0., 0., 0., 0.
-            if len(attempt) > 0:
-                last_type, last_e = attempt[-1]
-                if last_type == 'all_passes' and last_e['type'] == 'completed':
-                    a_id = last_e['player_id']
-                    a_x, a_y, a_dist, a_angle = _get_assist(last_e)
-            # add current score
-            home, away = self.result(ga['mins'], ga['secs'])
-            if ga['team_id'] == self.team_home['id']:
-                attack, defend = home, away
-            else:
-                attack, defend = away, home
-            # feats
-            feats = {'team_id': ga['team_id'],
-                     'player_id': ga['player_id'],
-                     'is_home': ga['team_id'] == self.team_home['id'],
-                     'headed': ga.get('headed', False),
-                     'is_goal': ga['type'] == 'goal',
-                     'distance': utils.euclidean(
-                         ga['end']['x'], ga['end']['y'], 100, 50),
-                     'possession': self.possession(
-                         mins, secs, team_id, injurytime=injurytime),
-                     'angle': utils.angle((ga['end']['x'], ga['end']['y'])),
-                     'x': ga['end']['x'], 'y': ga['end']['y'],
-                     'mins': ga['mins'], 'secs': ga['secs'],
-                     'assist_x': a_x, 'assist_y': a_y, 'assist_id': a_id,
-                     'assist_angle': a_angle, 'assist_dist': a_dist,
-                     'attack': attack, 'defend': defend}
-            # sequential data
-            for ftype, e in attempt:
-                if not utils.is_loc(e):  # skip unlocated events
-                    continue
-                seq.append({
-                    'x': e.get('start', e.get('loc'))['x'],
-                    'y': e.get('start', e.get('loc'))['y'],
-                    'end_x': e.get('end', {'x': ''})['x'],
-                    'end_y': e.get('end', {'y': ''})['y'],
-                    'mins': e['mins'], 'secs': e['secs'],
-                    'ftype': ftype, 'type': e.get('type', ''),
-                    'action_type': e.get('action_type', ''),
-                    'player_id': e['player_id'],
-                    'team_id': utils.get_team_id(e)})
-            yield bg, seq, feats
+        attempts = list(self.get_attempts(**kwargs))
+        yield from _xG_rows(
+            attempts, self._background_info(), self.team_home['id'],
+            self.results, self.possessions, stats=self.stats)
 
+    @utils.cache(maxsize=1024)
     def possession(self, mins, secs, team_id, injurytime=None):
         """
         Return ball possession of a given team for the previous 5 minutes
         to a given time (`mins`, `secs`) as a weighted mean of the possession
         in the current and the previous timeslice.
         """
-        if injurytime is not None:  # get possession from injury_time keyword
-            timeslice = '85 - 90' if mins >= 90 else '40 - 45'
-            xpath = POSSESION_IJP.format(timeslice, team_id, "1")
-            return int(self.xml.xpath(xpath)[0])
-        ts, mins = divmod(mins, 5)
-        timeslice = '{} - {}'.format(ts * 5, (ts + 1) * 5)
-        if ts * 5 >= 90:        # no injury time, return last timeslice
-            return int(self.xml.xpath(POSSESION.format('85 - 90', team_id))[0])
-        poss1 = int(self.xml.xpath(POSSESION.format(timeslice, team_id))[0])
-        if ts == 0:
-            return poss1
-        timeslice = '{} - {}'.format((ts - 1) * 5, ts * 5)
-        poss0 = int(self.xml.xpath(POSSESION.format(timeslice, team_id))[0])
-        weight1 = (mins / 5) + (secs / 60)
-        weight0 = ((5 - mins) / 5) + ((60 - secs) / 60)
-        return (weight0 * poss0 + weight1 * poss1) / 2
+        injurytime = [injurytime is not None]
+        poss = self.possessions([mins], [secs], [team_id], injurytime)
+        return _possession_values(poss, [mins], injurytime)[0]
+
+    def possessions(self, mins, secs, team_ids, injurytime=None):
+        """
+        Vectorized `possession` over arrays of times and team ids.
+        `injurytime` is a boolean array marking injury time events.
+        Unknown teams or missing slices result in NaN.
+        """
+        return _team_possessions(
+            self._parsed['possession'], mins, secs, team_ids,
+            injurytime=injurytime)
 
+    @property
     @utils.cache
+    def score_timeline(self):
+        """
+        Goal times (in seconds, sorted) and cumulative number of home goals
+        after each of them, built once per match.
+
+        Returns: (times, home), int arrays of length n_goals and
+            n_goals + 1 (home[k] is the home score after the first k goals)
+        """
+        table = self.event_table
+        idxs = table.timed_idxs(sort=True)
+        idxs = idxs[(table.ftype[idxs] == FTYPE_IDS['goals_attempts']) &
+                    (table.type[idxs] == 'goal')]
+        times = table.mins[idxs] * 60 + table.secs[idxs]
+        is_home = table.team[idxs] == self.team_home['id']
+        return times, np.concatenate([[0], np.cumsum(is_home)])
+
+    def results(self, mins, secs):
+        """
+        Vectorized `result` over arrays of times.
+
+        Returns: (home, away), int arrays with the score right before
+            each time
+        """
+        return _score_at(self.score_timeline, mins, secs)
+
     def result(self, mins, secs):
-        home, away = 0, 0
-        for attempt in self.get_attempts(filter_goals=True, breaks=0):
-            *_, (_, ga) = attempt
-            if ga['mins'] > mins:
-                break
-            else:
-                if ga['mins'] == mins and ga['secs'] >= secs:
-                    break
-            if utils.get_team_id(ga) == self.team_home['id']:
-                home += 1
-            else:
-                away += 1
-        return home, away
+        """Score (home, away) right before a given time (`mins`, `secs`)"""
+        times, home = self.score_timeline
+        goals = bisect.bisect_left(times, mins * 60 + secs)
+        return int(home[goals]), int(goals - home[goals])
+
+    def cache_info(self):
+        """Hits, misses and size of the memoized methods and properties"""
+        return {name: lru.info() for name, lru in self._cache.items()}
 
-    @utils.cache
     def get_player(self, player_id):
-        node = self.xml.xpath(PLAYER.format(player_id))[0]
-        return _parse_node(node)
+        return self._parsed['players'][player_id]
 
-    @utils.cache
     def get_team(self, team_id):
-        node = self.xml.xpath(TEAM.format(team_id))[0]
-        return _parse_node(node)
+        return self._parsed['teams'][team_id]
 
     @property
     def filters(self):
-        filters = self.xml.xpath('/squawka/data_panel/filters')
-        return [c.tag for c in filters[0].getchildren()]
+        return self._parsed['filters']
 
     @property
     def name(self):
-        return self.xml.xpath('/squawka/data_panel/game/name/text()')[0]
+        return self._parsed['name']
 
     @property
+    @utils.cache
     def score(self):
-        home_goals = self.xml.xpath(GOAL.format(self.team_home['id']))
-        away_goals = self.xml.xpath(GOAL.format(self.team_away['id']))
-        return len(home_goals), len(away_goals)
+        table = self.event_table
+        goals = table.filter_idxs('goals_attempts')
+        teams = table.team[goals[table.type[goals] == 'goal']]
+        home_goals = np.count_nonzero(teams == self.team_home['id'])
+        away_goals = np.count_nonzero(teams == self.team_away['id'])
+        return int(home_goals), int(away_goals)
 
     @property
     def team_home(self):
-        team = self.xml.xpath(HOME)[0]
-        return self.get_team(team.attrib['id'])
+        return self.get_team(self._parsed['home'])
 
     @property
     def team_away(self):
-        team = self.xml.xpath(AWAY)[0]
-        return self.get_team(team.attrib['id'])
+        return self.get_team(self._parsed['away'])
 
     @property
+    @utils.cache
     def competition(self):
-        match = re.match(COMP_ID, os.path.basename(self.path))
-        if match is not None:
-            comp, _ = match.groups()
-            return comp
-        # assume url was given as path
-        return re.findall("s3-irl-(.*)\.squawka\.com", self.path)[0]
+        competition, _ = _path_ids(self.path)
+        return competition
 
     @property
+    @utils.cache
     def match_id(self):
-        match = re.match(COMP_ID, os.path.basename(self.path))
-        if match is not None:
-            _, match_id = match.groups()
-            return match_id
-        # assume url was given as path
-        return re.findall("ingame/(.*)", self.path)[0]
+        _, match_id = _path_ids(self.path)
+        return match_id
 
     @property
     def kickoff(self):
-        date = self.xml.xpath("/squawka/data_panel/game/kickoff/text()")[0]
-        return datetime.strptime(date, '%a, %d %b %Y %H:%M:%S %z')
+        return self._parsed['kickoff']
 
     @property
     def venue(self):
-        return self.xml.xpath("/squawka/data_panel/game/venue/text()")[0]
+        return self._parsed['venue']
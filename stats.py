@@ -0,0 +1,71 @@
+import json
+import time
+from collections import defaultdict
+from contextlib import contextmanager, nullcontext
+
+
+class Stats(object):
+    """
+    Opt-in instrumentation: per-stage timers (in seconds) and counters.
+    Stats of different matches or documents can be aggregated with
+    `update`. Use NULL_STATS to disable instrumentation.
+    """
+    enabled = True
+
+    def __init__(self):
+        self.timers = defaultdict(float)
+        self.counts = defaultdict(int)
+
+    @contextmanager
+    def timer(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.timers[name] += time.perf_counter() - start
+            self.counts[name + '_calls'] += 1
+
+    def incr(self, name, n=1):
+        self.counts[name] += n
+
+    def update(self, other):
+        """Aggregate another Stats (or its dict version) into this one"""
+        if isinstance(other, Stats):
+            other = other.to_dict()
+        for name, value in other.get('timers', {}).items():
+            self.timers[name] += value
+        for name, value in other.get('counts', {}).items():
+            self.counts[name] += value
+        return self
+
+    def to_dict(self):
+        return {'timers': dict(self.timers), 'counts': dict(self.counts)}
+
+    def dump(self, path):
+        with open(path, 'w') as f:
+            json.dump(self.to_dict(), f, indent=2, sort_keys=True)
+
+    def report(self):
+        lines = ['{:<28}{:>12.2f}ms'.format(name, value * 1000)
+                 for name, value in sorted(self.timers.items())]
+        lines += ['{:<28}{:>14}'.format(name, value)
+                  for name, value in sorted(self.counts.items())]
+        return '\n'.join(lines)
+
+
+class NullStats(Stats):
+    """Disabled instrumentation, with (almost) no overhead"""
+    enabled = False
+    _null = nullcontext()
+
+    def timer(self, name):
+        return self._null
+
+    def incr(self, name, n=1):
+        pass
+
+    def update(self, other):
+        return self
+
+
+NULL_STATS = NullStats()
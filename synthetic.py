@@ -0,0 +1,197 @@
+import os
+import random
+from xml.sax.saxutils import quoteattr
+
+from utils import TIME_SLICE_EVENTS
+from squawka_match import ID_TEAM
+
+# filters whose events have start/end coordinates (the rest have loc)
+FORWARD = ('all_passes', 'crosses', 'corners', 'setpieces',
+           'goals_attempts', 'goal_keeping')
+# filters whose events are not timed
+UNTIMED = ('extra_heat_maps',)
+ATTEMPT_TYPES = ('saved', 'wide', 'wide', 'blocked', 'woodwork')
+PASS_TYPES = ('completed', 'completed', 'completed', 'failed')
+KICKOFF = 'Sat, 13 Aug 2016 12:30:00 +0000'
+
+
+def _slice_name(mins, injury_time):
+    ts = mins // 5
+    if not injury_time:
+        ts = min(ts, 17)
+    return '{} - {}'.format(ts * 5, ts * 5 + 5)
+
+
+def _event(rnd, ftype, mins, secs, team, player, other, players, goal=False):
+    attrs = {'player_id': player,
+             'team' if ftype in ID_TEAM else 'team_id': team}
+    if ftype not in UNTIMED:
+        attrs.update(mins=mins, secs=secs, minsec=mins * 60 + secs)
+    if ftype == 'goals_attempts':
+        attrs['type'] = 'goal' if goal else rnd.choice(ATTEMPT_TYPES)
+        attrs['action_type'] = rnd.choice(('shot', 'shot', 'header'))
+    elif ftype == 'all_passes':
+        attrs['type'] = rnd.choice(PASS_TYPES)
+    children = []
+    if ftype in FORWARD:
+        x, y = rnd.uniform(0, 100), rnd.uniform(0, 100)
+        if ftype == 'goals_attempts':
+            x, y = rnd.uniform(65, 99), rnd.uniform(25, 75)
+        children.append('<start>{:.1f},{:.1f}</start>'.format(x, y))
+        children.append('<end>{:.1f},{:.1f}</end>'.format(
+            rnd.uniform(x, 100), rnd.uniform(20, 80)))
+    else:
+        children.append('<loc>{:.1f},{:.1f}</loc>'.format(
+            rnd.uniform(0, 100), rnd.uniform(0, 100)))
+    if ftype == 'goals_attempts':
+        children.append('<headed>{}</headed>'.format(
+            'true' if attrs['action_type'] == 'header' else 'false'))
+    elif ftype == 'tackles':
+        children.append('<tackler team="{}">{}</tackler>'.format(
+            team, player))
+    elif ftype == 'fouls':
+        children.append('<otherplayer team="{}">{}</otherplayer>'.format(
+            other, rnd.choice(players[other])))
+    if mins >= 90 or (45 <= mins < 48 and secs < 30):
+        children.append('<injurytime_play>1</injurytime_play>')
+    return '<event {}>{}</event>'.format(
+        ' '.join('{}={}'.format(k, quoteattr(str(v)))
+                 for k, v in attrs.items()),
+        ''.join(children))
+
+
+def generate_match(events_per_filter=150, players_per_team=16, goals=3,
+                   injury_time=True, home='85', away='79', seed=0,
+                   until=None):
+    """
+    Generate a synthetic squawka xml with random but well-formed game,
+    players, possession and filter sections.
+
+    Parameters:
+    -----------
+    events_per_filter: int or dict (filter -> int), number of events of
+        each filter in utils.TIME_SLICE_EVENTS
+    players_per_team: int, number of players per team
+    goals: int, number of goals (included in the goals_attempts events)
+    injury_time: bool, whether to add injury time (minutes over 90,
+        possession slices and `injurytime_play` events)
+    home, away: str, team ids
+    seed: int, random seed
+    until: int, if given, only include events and possession slices before
+        this minute, as in a snapshot of a live match. Snapshots with the
+        same seed are consistent with each other.
+
+    Returns: str, the xml document
+    """
+    rnd = random.Random(seed)
+    teams = (home, away)
+    players = {t: [str(int(t) * 100 + i) for i in range(players_per_team)]
+               for t in teams}
+    last_min = 95 if injury_time else 90
+    out = ['<?xml version="1.0" encoding="UTF-8"?>',
+           '<squawka><data_panel><game>',
+           '<name>Team {} vs Team {}</name>'.format(home, away),
+           '<kickoff>{}</kickoff>'.format(KICKOFF),
+           '<venue>Stadium {}</venue>'.format(home)]
+    for team, state in zip(teams, ('home', 'away')):
+        out.append('<team id="{0}"><state>{1}</state>'
+                   '<long_name>Team {0}</long_name>'
+                   '<short_name>T{0}</short_name></team>'.format(team, state))
+    out.append('</game><players>')
+    for team in teams:
+        for player in players[team]:
+            out.append('<player id="{}" team_id="{}"><name>Player {}</name>'
+                       '<dob>{:02d}/{:02d}/19{}</dob><age>{}</age>'
+                       '<height>{}</height><weight>{}</weight>'
+                       '<shirt_num>{}</shirt_num></player>'.format(
+                           player, team, player, rnd.randint(1, 28),
+                           rnd.randint(1, 12), rnd.randint(80, 99),
+                           rnd.randint(18, 36), rnd.randint(165, 200),
+                           rnd.randint(60, 95), int(player) % 100 + 1))
+    out.append('</players><possession>')
+    for period, (first, last) in enumerate(((0, 45), (45, last_min)), 1):
+        out.append('<period id="{}">'.format(period))
+        for ts in range(first, last, 5):
+            poss = rnd.randint(30, 70)
+            if until is not None and ts >= until:
+                continue
+            out.append('<time_slice name="{} - {}">'.format(ts, ts + 5))
+            for team, value in zip(teams, (poss, 100 - poss)):
+                out.append('<team_possession team_id="{}">{}'
+                           '</team_possession>'.format(team, value))
+            out.append('</time_slice>')
+        out.append('</period>')
+    out.append('</possession><filters>')
+    for ftype in TIME_SLICE_EVENTS:
+        n = events_per_filter.get(ftype, 0) \
+            if isinstance(events_per_filter, dict) else events_per_filter
+        n_goals = min(goals, n) if ftype == 'goals_attempts' else 0
+        times = sorted((rnd.randint(0, last_min - 1), rnd.randint(0, 59))
+                       for _ in range(n))
+        is_goal = [True] * n_goals + [False] * (n - n_goals)
+        rnd.shuffle(is_goal)
+        out.append('<{}>'.format(ftype))
+        current = None
+        for (mins, secs), goal in zip(times, is_goal):
+            team = rnd.choice(teams)
+            other = away if team == home else home
+            event = _event(rnd, ftype, mins, secs, team,
+                           rnd.choice(players[team]), other, players,
+                           goal=goal)
+            if until is not None and mins >= until:
+                continue
+            name = _slice_name(mins, injury_time)
+            if name != current:
+                if current is not None:
+                    out.append('</time_slice>')
+                out.append('<time_slice name="{}">'.format(name))
+                current = name
+            out.append(event)
+        if current is not None:
+            out.append('</time_slice>')
+        out.append('</{}>'.format(ftype))
+    out.append('</filters></data_panel></squawka>')
+    return '\n'.join(out)
+
+
+def write_corpus(dirpath, n_matches, competition='synthetic', seed=0,
+                 **kwargs):
+    """
+    Write `n_matches` synthetic matches to `dirpath` as
+    <competition>_<match_id>.xml files. Extra kwargs are passed to
+    generate_match.
+
+    Returns: list of written paths
+    """
+    os.makedirs(dirpath, exist_ok=True)
+    paths, team_ids = [], [str(t) for t in range(10, 30)]
+    rnd = random.Random(seed)
+    for idx in range(n_matches):
+        home, away = rnd.sample(team_ids, 2)
+        path = os.path.join(
+            dirpath, '{}_{}.xml'.format(competition, 1000 + idx))
+        with open(path, 'w') as f:
+            f.write(generate_match(home=home, away=away, seed=seed + idx,
+                                   **kwargs))
+        paths.append(path)
+    return paths
+
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(
+        description='Generate synthetic squawka xml files')
+    parser.add_argument('dirpath')
+    parser.add_argument('--n_matches', type=int, default=10)
+    parser.add_argument('--competition', default='synthetic')
+    parser.add_argument('--events_per_filter', type=int, default=150)
+    parser.add_argument('--players_per_team', type=int, default=16)
+    parser.add_argument('--goals', type=int, default=3)
+    parser.add_argument('--no_injury_time', action='store_true')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    write_corpus(args.dirpath, args.n_matches, competition=args.competition,
+                 seed=args.seed, events_per_filter=args.events_per_filter,
+                 players_per_team=args.players_per_team, goals=args.goals,
+                 injury_time=not args.no_injury_time)
@@ -0,0 +1,79 @@
+import os
+
+import pytest
+
+from fetch import Fetcher, serve_dir, match_ids
+
+
+@pytest.fixture
+def server(tmp_path):
+    src = tmp_path / 'src'
+    src.mkdir()
+    for match_id in ('1000', '1001'):
+        (src / 'epl_{}.xml'.format(match_id)).write_bytes(
+            '<squawka>{}</squawka>'.format(match_id).encode() * 100)
+    server = serve_dir(str(src))
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def _fetcher(server, dirpath, **kwargs):
+    template = 'http://127.0.0.1:{}/{{competition}}/ingame/{{match_id}}'
+    return Fetcher(str(dirpath), backoff=0.01, concurrency=1,
+                   url_template=template.format(server.server_address[1]),
+                   **kwargs)
+
+
+def _counts(fetcher):
+    return fetcher.stats.to_dict()['counts']
+
+
+def test_fetch(server, tmp_path):
+    fetcher = _fetcher(server, tmp_path / 'dst')
+    results = fetcher.run(match_ids('epl', 1000, 1002))
+    assert results == {('epl', '1000'): 'fetched',
+                       ('epl', '1001'): 'fetched'}
+    for filename in ('epl_1000.xml', 'epl_1001.xml'):
+        with open(os.path.join(server.dirpath, filename), 'rb') as f, \
+             open(str(tmp_path / 'dst' / filename), 'rb') as g:
+            assert f.read() == g.read()
+
+
+def test_not_modified(server, tmp_path):
+    _fetcher(server, tmp_path / 'dst').run(match_ids('epl', 1000, 1002))
+    # the manifest validators are sent back, unchanged matches are skipped
+    fetcher = _fetcher(server, tmp_path / 'dst')
+    results = fetcher.run(match_ids('epl', 1000, 1002))
+    assert set(results.values()) == {'not_modified'}
+    assert 'bytes' not in _counts(fetcher)
+    # changed files are fetched again
+    path = os.path.join(server.dirpath, 'epl_1001.xml')
+    with open(path, 'wb') as f:
+        f.write(b'<squawka>changed</squawka>')
+    results = _fetcher(server, tmp_path / 'dst').run(
+        match_ids('epl', 1000, 1002))
+    assert results[('epl', '1001')] == 'fetched'
+    assert results[('epl', '1000')] == 'not_modified'
+
+
+def test_retry(server, tmp_path):
+    server.fail_every = 2       # every second request is a 503
+    fetcher = _fetcher(server, tmp_path / 'dst')
+    results = fetcher.run(match_ids('epl', 1000, 1002))
+    assert set(results.values()) == {'fetched'}
+    assert _counts(fetcher)['retries'] == 1
+
+
+def test_retries_exhausted(server, tmp_path):
+    server.fail_every = 1
+    fetcher = _fetcher(server, tmp_path / 'dst', retries=1)
+    results = fetcher.run(match_ids('epl', 1000, 1001))
+    assert results == {('epl', '1000'): 'failed'}
+
+
+def test_missing(server, tmp_path):
+    fetcher = _fetcher(server, tmp_path / 'dst')
+    results = fetcher.run([('epl', '1005'), ('liga', '1000')])
+    assert set(results.values()) == {'missing'}
+    assert not os.path.exists(str(tmp_path / 'dst' / 'epl_1005.xml'))
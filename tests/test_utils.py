@@ -0,0 +1,69 @@
+import numpy as np
+import pytest
+
+import utils
+
+
+def _scalar_angle(v1, v2=None):
+    try:
+        return utils.angle(v1, v2)
+    except ZeroDivisionError:   # degenerate, a point lies on the origin
+        return 0.
+
+
+def _points(n, seed):
+    rnd = np.random.RandomState(seed)
+    x, y = rnd.uniform(0, 100, n), rnd.uniform(0, 100, n)
+    # edge cases: goal (the origin), corners, posts and pitch lines
+    edges = np.array([(100, 50), (100, 0), (100, 100), (0, 0), (0, 100),
+                      (0, 50), (50, 50), (100, 45), (100, 55), (99.9, 50),
+                      (50, 0), (50, 100)], dtype=float)
+    return np.concatenate([x, edges[:, 0]]), np.concatenate([y, edges[:, 1]])
+
+
+def _floats(*arrays):
+    # python floats, so that the scalar functions raise on degenerate input
+    return [np.asarray(a).tolist() for a in arrays]
+
+
+@pytest.mark.parametrize('seed', [0, 1, 2])
+def test_shot_features(seed):
+    x, y = _points(500, seed)
+    distances, angles = utils.shot_features(x, y)
+    x, y = _floats(x, y)
+    for i in range(len(x)):
+        assert distances[i] == pytest.approx(
+            utils.euclidean(x[i], y[i], 100, 50), abs=1e-9)
+        assert angles[i] == pytest.approx(
+            _scalar_angle((x[i], y[i])), abs=1e-9)
+
+
+@pytest.mark.parametrize('seed', [0, 1, 2])
+def test_assist_features(seed):
+    from_x, from_y = _points(500, seed)
+    to_x, to_y = _points(500, seed + 10)
+    # zero-length passes and passes from or to the origin
+    from_x, from_y = np.append(from_x, [30, 100, 20]), \
+        np.append(from_y, [40, 50, 20])
+    to_x, to_y = np.append(to_x, [30, 20, 100]), np.append(to_y, [40, 20, 50])
+    dists, angles = utils.assist_features(from_x, from_y, to_x, to_y)
+    from_x, from_y, to_x, to_y = _floats(from_x, from_y, to_x, to_y)
+    for i in range(len(from_x)):
+        dist = utils.euclidean(from_x[i], from_y[i], to_x[i], to_y[i])
+        angle = 0.
+        if dist > 0:
+            angle = _scalar_angle((from_x[i], from_y[i]), (to_x[i], to_y[i]))
+        assert dists[i] == pytest.approx(dist, abs=1e-9)
+        assert angles[i] == pytest.approx(angle, abs=1e-9)
+
+
+def test_degenerate_angles():
+    # shots from the origin and zero-length assists have a 0 angle
+    _, angles = utils.shot_features([100.], [50.])
+    assert angles.tolist() == [0.]
+    dists, angles = utils.assist_features([30.], [40.], [30.], [40.])
+    assert dists.tolist() == [0.] and angles.tolist() == [0.]
+    _, angles = utils.assist_features([100.], [50.], [20.], [20.])
+    assert angles.tolist() == [0.]
+    with pytest.raises(ZeroDivisionError):
+        utils.angle((100, 50))
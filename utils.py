@@ -1,5 +1,9 @@
 
+import functools
 import math
+from collections import OrderedDict
+
+import numpy as np
 
 
 COMPETITIONS = {
@@ -47,16 +51,61 @@ TIME_SLICE_EVENTS = [
 ]
 
 
-def cache(method, prop='_cache'):
-    def wrapper(self, arg, *args, **kwargs):
+class LRUCache(object):
+    """Bounded mapping evicting least recently used items, with stats"""
+    def __init__(self, maxsize=128):
+        self.maxsize, self.data = maxsize, OrderedDict()
+        self.hits, self.misses = 0, 0
+
+    def get(self, key, default=None):
+        if key in self.data:
+            self.hits += 1
+            self.data.move_to_end(key)
+            return self.data[key]
+        self.misses += 1
+        return default
+
+    def set(self, key, item):
+        self.data[key] = item
+        self.data.move_to_end(key)
+        if self.maxsize is not None and len(self.data) > self.maxsize:
+            self.data.popitem(last=False)
+
+    def info(self):
+        return {'hits': self.hits, 'misses': self.misses,
+                'size': len(self.data), 'maxsize': self.maxsize}
+
+
+_MISSING = object()
+
+
+def cache(method=None, maxsize=128, prop='_cache'):
+    """
+    Memoize a method per instance in a LRUCache of at most `maxsize`
+    items, keyed on all arguments. Caches are stored by method name in
+    the dict attribute `prop` of the instance. Can be used with or
+    without arguments, and stacked under @property.
+    """
+    if method is None:
+        return functools.partial(cache, maxsize=maxsize, prop=prop)
+
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
         key = method.__name__
         if not hasattr(self, prop):
             raise ValueError("Class needs a {} property".format(prop))
-        cached = getattr(self, prop).get(key, {}).get(arg, None)
-        if cached is not None:
+        caches = getattr(self, prop)
+        if key not in caches:
+            caches[key] = LRUCache(maxsize=maxsize)
+        args_key = args + tuple(sorted(kwargs.items())) if kwargs else args
+        try:
+            cached = caches[key].get(args_key, _MISSING)
+        except TypeError:       # unhashable arguments
+            return method(self, *args, **kwargs)
+        if cached is not _MISSING:
             return cached
-        item = method(self, arg, *args, **kwargs)
-        self._cache[key][arg] = item
+        item = method(self, *args, **kwargs)
+        caches[key].set(args_key, item)
         return item
     return wrapper
 
@@ -103,3 +152,48 @@ def angle(v1, v2=None, origin=(100, 50)):
 
 def to_degrees(radians):
     return radians * (180 / math.pi)
+
+
+# vectorized versions of the geometry functions above, operating on
+# arrays of coordinates (in the 0-100 squawka units)
+
+def transform_locs(x, y):
+    """Vectorized `transform_loc`"""
+    return np.asarray(x, dtype=float) * 1.05, np.asarray(y, dtype=float) * 0.6
+
+
+def euclidean_array(x1, y1, x2, y2):
+    """Vectorized `euclidean`"""
+    (x1, y1), (x2, y2) = transform_locs(x1, y1), transform_locs(x2, y2)
+    return np.sqrt(((x2 - x1) ** 2) + (np.abs(y2 - y1) ** 2))
+
+
+def angle_array(x1, y1, x2=None, y2=None, origin=(100, 50)):
+    """Vectorized `angle`. Degenerate angles, where one of the points
+    lies on the origin, are returned as 0 instead of raising"""
+    x1, y1 = np.asarray(x1, dtype=float), np.asarray(y1, dtype=float)
+    if x2 is None:
+        x2, y2 = np.full_like(x1, 100), np.where(y1 <= 50, 0., 100.)
+    v1x, v1y = transform_locs(x1 - origin[0], y1 - origin[1])
+    v2x, v2y = transform_locs(np.asarray(x2) - origin[0],
+                              np.asarray(y2) - origin[1])
+    norm = np.sqrt(v1x * v1x + v1y * v1y) * np.sqrt(v2x * v2x + v2y * v2y)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        cos = (v1x * v2x + v1y * v2y) / norm
+    # clip rounding errors outside of acos domain
+    return np.where(norm > 0, np.arccos(np.clip(cos, -1, 1)), 0.)
+
+
+def shot_features(x, y):
+    """Distance (in meters) and angle to the attacking goal of shots
+    taken from arrays of coordinates `x`, `y`"""
+    return euclidean_array(x, y, 100, 50), angle_array(x, y)
+
+
+def assist_features(from_x, from_y, to_x, to_y):
+    """Distance and angle of assisting passes. Angles of zero-length
+    passes are 0 (see squawka_match.SquawkaMatch.xGs)"""
+    dist = euclidean_array(from_x, from_y, to_x, to_y)
+    angle = np.where(
+        dist > 0, angle_array(from_x, from_y, to_x, to_y), 0.)
+    return dist, angle